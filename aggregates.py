@@ -0,0 +1,178 @@
+import sys
+
+# Running per-question statistics kept next to the raw results in
+# data/{subject}/results.sqlite. They are updated inside the same SQLite
+# transaction that stores a submission, so concurrent sessions cannot lose
+# updates, and each submission costs a handful of primary-key upserts no
+# matter how many students have already submitted.
+
+HISTOGRAM_BINS = 10  # similarity 0-100 in buckets of 10, 100 falls in the last one
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS question_stats (
+    date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    total_sq REAL NOT NULL DEFAULT 0,
+    min REAL,
+    max REAL,
+    PRIMARY KEY (date, session, question)
+);
+CREATE TABLE IF NOT EXISTS question_histogram (
+    date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, session, question, bin)
+);
+CREATE TABLE IF NOT EXISTS exam_totals (
+    date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    total_students INTEGER NOT NULL DEFAULT 0,
+    total_plagiarism_score REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, session)
+);
+"""
+
+
+def histogram_bin(score):
+    return min(int(score // (100 / HISTOGRAM_BINS)), HISTOGRAM_BINS - 1)
+
+
+def _remove_score(conn, date, session, question, score):
+    conn.execute("""UPDATE question_stats SET count = count - 1, total = total - ?, total_sq = total_sq - ?
+                    WHERE date = ? AND session = ? AND question = ?""",
+                 (score, score * score, date, session, question))
+    conn.execute("""UPDATE question_histogram SET count = count - 1
+                    WHERE date = ? AND session = ? AND question = ? AND bin = ?""",
+                 (date, session, question, histogram_bin(score)))
+    conn.execute("DELETE FROM question_histogram WHERE date = ? AND session = ? AND question = ? AND count = 0",
+                 (date, session, question))
+
+def _add_score(conn, date, session, question, score):
+    conn.execute("""INSERT INTO question_stats (date, session, question, count, total, total_sq, min, max)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                    ON CONFLICT (date, session, question) DO UPDATE SET
+                        count = count + 1, total = total + excluded.total,
+                        total_sq = total_sq + excluded.total_sq,
+                        min = MIN(COALESCE(min, excluded.min), excluded.min),
+                        max = MAX(COALESCE(max, excluded.max), excluded.max)""",
+                 (date, session, question, score, score * score, score, score))
+    conn.execute("""INSERT INTO question_histogram (date, session, question, bin, count) VALUES (?, ?, ?, ?, 1)
+                    ON CONFLICT (date, session, question, bin) DO UPDATE SET count = count + 1""",
+                 (date, session, question, histogram_bin(score)))
+
+def _refresh_min_max(conn, date, session, question):
+    # A removed score may have been the current min/max; the
+    # (date, session, question, plagiarism) index makes this a seek
+    conn.execute("""UPDATE question_stats SET
+                        min = (SELECT MIN(plagiarism) FROM results WHERE date = ? AND session = ? AND question = ?),
+                        max = (SELECT MAX(plagiarism) FROM results WHERE date = ? AND session = ? AND question = ?)
+                    WHERE date = ? AND session = ? AND question = ?""",
+                 (date, session, question) * 3)
+
+def _add_totals(conn, date, session, new_students, score_delta):
+    conn.execute("""INSERT INTO exam_totals (date, session, total_students, total_plagiarism_score) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (date, session) DO UPDATE SET
+                        total_students = total_students + excluded.total_students,
+                        total_plagiarism_score = total_plagiarism_score + excluded.total_plagiarism_score""",
+                 (date, session, new_students, score_delta))
+
+
+def apply_submission(conn, date, session, old_scores, new_scores):
+    # old_scores / new_scores map question -> plagiarism score for one student.
+    # Must run inside the caller's write transaction (BEGIN IMMEDIATE).
+    for question, score in old_scores.items():
+        if score is not None:
+            _remove_score(conn, date, session, question, score)
+    for question, score in new_scores.items():
+        if score is not None:
+            _add_score(conn, date, session, question, score)
+    for question in old_scores:
+        _refresh_min_max(conn, date, session, question)
+
+    score_delta = sum(s for s in new_scores.values() if s is not None) - \
+        sum(s for s in old_scores.values() if s is not None)
+    _add_totals(conn, date, session, 0 if old_scores else 1, score_delta)
+
+
+def apply_rescore(conn, date, session, changes):
+    # changes: (question, old score, new score) of answers scored again in
+    # place, e.g. after the answer key was corrected. The results rows must
+    # already hold the new scores. Runs inside the caller's write transaction.
+    questions = set()
+    score_delta = 0
+    for question, old_score, new_score in changes:
+        if old_score == new_score:
+            continue
+        if old_score is not None:
+            _remove_score(conn, date, session, question, old_score)
+            score_delta -= old_score
+        if new_score is not None:
+            _add_score(conn, date, session, question, new_score)
+            score_delta += new_score
+        questions.add(question)
+    # min/max once per question rather than once per answer
+    for question in sorted(questions):
+        _refresh_min_max(conn, date, session, question)
+    if questions:
+        _add_totals(conn, date, session, 0, score_delta)
+
+
+def rebuild(subject):
+    # Recompute every aggregate of the subject from the raw results table
+    from results_store import bump_version, connect
+
+    conn = connect(subject)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            bump_version(conn)
+            conn.execute("DELETE FROM question_stats")
+            conn.execute("DELETE FROM question_histogram")
+            conn.execute("DELETE FROM exam_totals")
+            conn.execute("""INSERT INTO question_stats
+                            SELECT date, session, question, COUNT(plagiarism), COALESCE(SUM(plagiarism), 0),
+                                   COALESCE(SUM(plagiarism * plagiarism), 0), MIN(plagiarism), MAX(plagiarism)
+                            FROM results GROUP BY date, session, question""")
+            conn.execute(f"""INSERT INTO question_histogram
+                             SELECT date, session, question,
+                                    MIN(CAST(plagiarism / {100 / HISTOGRAM_BINS} AS INTEGER), {HISTOGRAM_BINS - 1}) AS bin,
+                                    COUNT(*)
+                             FROM results WHERE plagiarism IS NOT NULL GROUP BY date, session, question, bin""")
+            conn.execute("""INSERT INTO exam_totals
+                            SELECT date, session, COUNT(DISTINCT student), COALESCE(SUM(plagiarism), 0)
+                            FROM results GROUP BY date, session""")
+    finally:
+        conn.close()
+
+
+def load_overall(subject, date=None, session=None):
+    # Same layout as the former overall_plagiarism.csv, for all exams of the
+    # subject or only the given date and/or session
+    import pandas as pd
+    from results_store import connect
+
+    filters = {"date": date, "session": session}
+    clauses = [f"{column} = ?" for column, value in filters.items() if value is not None]
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    conn = connect(subject)
+    try:
+        return pd.read_sql_query(f"""SELECT ? AS subject, COALESCE(SUM(total_students), 0) AS total_students,
+                                            COALESCE(SUM(total_plagiarism_score), 0) AS total_plagiarism_score
+                                     FROM exam_totals{where}""",
+                                 conn, params=[subject] + [value for value in filters.values() if value is not None])
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # python aggregates.py rebuild SUBJECT [SUBJECT ...]
+    if len(sys.argv) < 3 or sys.argv[1] != "rebuild":
+        sys.exit("usage: python aggregates.py rebuild SUBJECT [SUBJECT ...]")
+    for subject in sys.argv[2:]:
+        rebuild(subject)
+        print(f"{subject}: aggregates rebuilt")
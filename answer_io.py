@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import tempfile
+
+# Student answers on disk and in memory.
+#
+# save_answers writes data/{subject}/{student_id}_answers.jsonl with one JSON
+# record per question, so answers containing newlines (or "Q2: " at the
+# start of a line) round-trip exactly. Records also carry the exam's date and
+# session: a student's file holds only their latest submission in the
+# subject, which may belong to an earlier exam than the one being looked at. Answer files in the older
+# "Q{i}: {answer}" text format (*_answers.txt) are still read.
+#
+# Readers are generators: iter_answer_records yields one
+# (student, question, text) record at a time however many files there are.
+
+ANSWERS_SUFFIX = "_answers.jsonl"
+LEGACY_SUFFIX = "_answers.txt"
+
+# One line per answer in the legacy format: "Q{i}: {answer}"
+ANSWER_LINE = re.compile(r"^Q(\d+): (.*)$")
+
+
+# --- Writing ---
+def write_answers(subject, student_id, answers, date="", session=""):
+    if not os.path.exists(f'data/{subject}'):
+        os.makedirs(f'data/{subject}')
+
+    path = f"data/{subject}/{student_id}{ANSWERS_SUFFIX}"
+    # A temporary file of its own, so concurrent saves of one student never share it
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{student_id}", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for i, answer in enumerate(answers, 1):
+                f.write(json.dumps({"student": student_id, "question": i, "answer": answer,
+                                    "date": date, "session": session}, ensure_ascii=False) + "\n")
+        # Readers never see a half-written file
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    legacy_path = f"data/{subject}/{student_id}{LEGACY_SUFFIX}"
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+# --- Streaming readers ---
+def iter_answer_file(path):
+    # Yields (student, question, text) for one answer file of either format
+    name = os.path.basename(path)
+    if name.endswith(ANSWERS_SUFFIX):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["student"], record["question"], record["answer"]
+        return
+
+    student_id = name[:-len(LEGACY_SUFFIX)]
+    question, text = None, None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            match = ANSWER_LINE.match(line)
+            if match:
+                if question is not None:
+                    yield student_id, question, text
+                question, text = int(match.group(1)), match.group(2)
+            elif question is not None:
+                # Continuation of an answer that contained a newline
+                text += "\n" + line
+    if question is not None:
+        yield student_id, question, text
+
+def answer_file_exam(path):
+    # (date, session) an answer file was submitted for; None for legacy text
+    # files and for .jsonl files written before answers recorded it
+    if not path.endswith(ANSWERS_SUFFIX):
+        return None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                return (record["date"], record["session"]) if "date" in record and "session" in record else None
+    return None
+
+def answer_file_matches(path, date=None, session=None):
+    # Whether the file was recorded for the given date and/or session (no filter: always)
+    if date is None and session is None:
+        return True
+    exam = answer_file_exam(path)
+    return exam is not None and date in (None, exam[0]) and session in (None, exam[1])
+
+def iter_answer_files(answers_dir):
+    with os.scandir(answers_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(ANSWERS_SUFFIX):
+                yield entry.path
+            elif entry.name.endswith(LEGACY_SUFFIX):
+                # A newer .jsonl submission of the same student wins
+                student_id = entry.name[:-len(LEGACY_SUFFIX)]
+                if not os.path.exists(os.path.join(answers_dir, student_id + ANSWERS_SUFFIX)):
+                    yield entry.path
+
+def iter_answer_records(answers_dir):
+    for path in iter_answer_files(answers_dir):
+        yield from iter_answer_file(path)
+
+def read_answers(path):
+    # Answers of one file as a list, in question order
+    return [text for _, _, text in sorted(iter_answer_file(path), key=lambda record: record[1])]
+
+def iter_submissions(answers_dir, date=None, session=None):
+    # Lazily yield (student_id, answers), one answer file at a time. Given a
+    # date and/or session, only files recorded for that exam are read.
+    for path in iter_answer_files(answers_dir):
+        if not answer_file_matches(path, date, session):
+            continue
+        records = sorted(iter_answer_file(path), key=lambda record: record[1])
+        if records:
+            yield records[0][0], [text for _, _, text in records]
+
@@ -1,11 +1,16 @@
 import streamlit as st
-import spacy
-from fuzzywuzzy import fuzz
-import pandas as pd
 import os
-import altair as alt
+import time
 from datetime import datetime
-import plotly.express as px
+
+# pandas and plotly are imported inside the functions that use them so that
+# pages which never touch them do not pay for the import on every rerun
+import config
+from resources import cache_data, get_grading_queue, get_eval_cache, get_exam_registry
+from grading_queue import enqueue, job_status, metrics
+from answer_io import write_answers
+from metrics import REGISTRY, inc, profiled, set_gauge, span
+from dashboard_data import student_view, overall_view, cohort_view, questions_view
 
 
 #streamlit app
@@ -27,12 +32,12 @@ background-color: rgba(0,0,0,0);
 
 # Apply the styling using st.markdown
 st.markdown(page_bg, unsafe_allow_html=True)
-# Load NLP model for grammar check
-nlp = spacy.load('en_core_web_sm')
 
 
 # --- Helper Functions ---
-def save_questions(subject, num_questions, questions, correct_answers, date, session):
+def save_questions(subject, num_questions, questions, correct_answers, date, session, source="faculty dashboard"):
+    import pandas as pd
+
     if not os.path.exists(f'data/{subject}'):
         os.makedirs(f'data/{subject}')
 
@@ -47,91 +52,67 @@ def save_questions(subject, num_questions, questions, correct_answers, date, ses
     df = pd.DataFrame(question_data)
     df.to_csv(f"data/{subject}/{subject}_questions.csv", index=False)
 
-def save_answers(student_id, subject, answers):
-    if not os.path.exists(f'data/{subject}'):
-        os.makedirs(f'data/{subject}')
-    
-    # Save answers to a file specific to the subject
-    with open(f"data/{subject}/{student_id}_answers.txt", "w") as f:
-        for i, answer in enumerate(answers, 1):
-            f.write(f"Q{i}: {answer}\n")
-
-def plagiarism_check(answers, correct_answers):
-    plagiarism_results = []
-    for answer, correct_answer in zip(answers, correct_answers):
-        similarity = fuzz.ratio(answer, correct_answer)
-        plagiarism_results.append(similarity)
-    return plagiarism_results
-
-def grammar_check(doc):
-    errors = [token.text for token in doc if token.pos_ == "X"]
-    return len(errors)
-
-def save_performance(student_id, subject, plagiarism_results, grammar_errors, num_questions):
-    # Create a dictionary to hold performance data
-    result_data = {
-        "subject": subject,
-        "student": student_id,
-    }
-
-    for i in range(num_questions):
-        result_data[f'q{i + 1}_plagiarism'] = plagiarism_results[i]
-        result_data[f'q{i + 1}_grammar_errors'] = grammar_errors[i]
-
-    # Save student performance data in a separate CSV file for each student
-    file_path = f"data/{subject}/{student_id}_performance.csv"
-    pd.DataFrame([result_data]).to_csv(file_path, index=False)
-
-    # Update overall plagiarism data
-    update_overall_plagiarism(subject, plagiarism_results)
-
-def update_overall_plagiarism(subject, plagiarism_results):
-    overall_file_path = f"data/{subject}/overall_plagiarism.csv"
-    
-    if os.path.exists(overall_file_path):
-        overall_data = pd.read_csv(overall_file_path)
-    else:
-        overall_data = pd.DataFrame(columns=["subject", "total_students", "total_plagiarism_score"])
-
-    total_plagiarism_score = sum(plagiarism_results)
-    total_students = overall_data['total_students'].sum() + 1  # Increment for new student
-    
-    # Check if the subject already exists in the overall_data DataFrame
-    if overall_data.empty or overall_data['subject'].iloc[0] != subject:
-        new_data = pd.DataFrame({
-            "subject": [subject],
-            "total_students": [total_students],
-            "total_plagiarism_score": [total_plagiarism_score]
-        })
-        overall_data = pd.concat([overall_data, new_data], ignore_index=True)
-    else:
-        overall_data.at[0, "total_students"] = total_students
-        overall_data.at[0, "total_plagiarism_score"] += total_plagiarism_score
-
-    overall_data.to_csv(overall_file_path, index=False)
+    # Store a new version in the question bank and publish it to every session and worker
+    registry = get_exam_registry()
+    previous = registry.lookup(subject, date, session)
+    registry.publish(subject, date, session, questions, correct_answers, source)
+
+    # Embed the answer key once so grading only embeds student answers
+    if config.SEMANTIC_SCORING:
+        from semantic import save_key_embeddings
+        save_key_embeddings(subject, correct_answers)
+
+    # Cached evaluations of questions whose correct answer changed are stale
+    eval_cache = get_eval_cache()
+    if eval_cache is not None:
+        eval_cache.invalidate_changed(subject, correct_answers)
+
+    # Re-saving the same exam with a corrected key re-scores the answers
+    # already graded, but only for the questions whose answer changed
+    if previous is not None:
+        from regrade import changed_questions, regrade
+        return regrade(subject, changed_questions(previous["correct_answers"], correct_answers), correct_answers,
+                       date, session)
+
+def show_regrade_report(report):
+    if report and report["questions"]:
+        st.info(f"Answer key changed for question(s) {', '.join(map(str, report['questions']))}: "
+                f"re-graded {report['records']} answers of {report['students']} students "
+                f"in {report['seconds']:.1f}s.")
+
+@cache_data(max_entries=2)
+def load_queue_metrics(period):
+    # Shared by every session and rerun; a new period (GRADER_METRICS_TTL
+    # seconds long) queries the queue again
+    return metrics()
+
+def save_answers(student_id, subject, answers, date="", session=""):
+    # Save answers to a file specific to the subject (one JSON record per question)
+    write_answers(subject, student_id, answers, date, session)
 
 
 # Function to display the dashboard based on selected subject, date, and session
 # Function to display the dashboard based on selected subject, date, and session
 def display_dashboard(selected_subject, selected_date, selected_session, student_id):
-    # Construct file paths
-    performance_file_path = f'data/{selected_subject}/{student_id}_performance.csv'
-    questions_file_path = f"data/{selected_subject}/{selected_subject}_questions.csv"
-    overall_plagiarism_path = f'data/{selected_subject}/overall_plagiarism.csv'
-    
+    import pandas as pd
+    import plotly.express as px
+
+    render_start = time.perf_counter()
+
     # Handle individual student analytics at the top
     if student_id:
-        if os.path.exists(performance_file_path):
+        # Cached until this student's results or peers change
+        with span("dashboard_student_data"):
+            student_data = student_view(selected_subject, student_id, selected_date, selected_session)
+        if student_data["performance"] is not None:
             try:
-                # Read student performance data
-                student_performance_data = pd.read_csv(performance_file_path)
                 st.subheader(f"Performance Data for Student {student_id}")
-                st.write(student_performance_data)
+                st.write(student_data["performance"])
 
                 # Plagiarism and Grammar errors
-                questions = [f'q{i + 1}' for i in range(len(student_performance_data.columns) - 2)]
-                plagiarism_scores = [student_performance_data[f'q{i + 1}_plagiarism'][0] for i in range(len(questions))]
-                grammar_errors = [student_performance_data[f'q{i + 1}_grammar_errors'][0] for i in range(len(questions))]
+                questions = student_data["questions"]
+                plagiarism_scores = student_data["plagiarism_scores"]
+                grammar_errors = student_data["grammar_errors"]
 
                 # Bar chart for plagiarism scores
                 fig_student = px.bar(x=questions, 
@@ -161,11 +142,25 @@ def display_dashboard(selected_subject, selected_date, selected_session, student
         else:
             st.warning(f"No performance data available for student {student_id}.")
 
+        # Passages taken word for word from the answer key
+        if student_data.get("copied") is not None:
+            st.subheader("Passages Copied from the Answer Key")
+            st.caption("coverage: % of the answer copied; key_coverage: % of the key that appears in the answer")
+            st.write(student_data["copied"])
+
+        # Peers whose answers are suspiciously similar to this student's
+        peers_data = student_data["peers"]
+        if peers_data is not None:
+            if not peers_data.empty:
+                st.subheader("Similar Submissions by Other Students")
+                st.write(peers_data)
+
     # Check if overall performance data exists
-    if os.path.exists(overall_plagiarism_path):
+    with span("dashboard_overall_data"):
+        overall_data = overall_view(selected_subject, selected_date, selected_session)
+    if overall_data is not None:
         try:
-            # Read overall plagiarism data
-            overall_data = pd.read_csv(overall_plagiarism_path)
+            # Overall plagiarism data (running totals, no per-student reads)
             st.subheader("Overall Plagiarism Statistics")
             st.write(overall_data)
 
@@ -184,11 +179,45 @@ def display_dashboard(selected_subject, selected_date, selected_session, student
     else:
         st.warning("No overall plagiarism data available.")
 
+    # Per-question distributions across all students of the selected exam
+    with span("dashboard_cohort_data"):
+        cohort = cohort_view(selected_subject, selected_date, selected_session)
+    if cohort is not None and cohort["students"]:
+        try:
+            st.subheader(f"Cohort Analytics ({cohort['students']} students)")
+            st.write(cohort["questions"])
+
+            # Similarity histogram per question
+            st.plotly_chart(px.bar(cohort["histogram"],
+                                   x='bin',
+                                   y='count',
+                                   color='question',
+                                   barmode='group',
+                                   title='Distribution of Plagiarism Scores by Question',
+                                   labels={'bin': 'Plagiarism Score', 'count': 'Students'}))
+
+            # Grammar errors per question
+            st.plotly_chart(px.bar(cohort["grammar"],
+                                   x='grammar_errors',
+                                   y='answers',
+                                   color='question',
+                                   barmode='group',
+                                   title='Distribution of Grammar Errors by Question',
+                                   labels={'grammar_errors': 'Grammar Errors', 'answers': 'Answers'}))
+
+            if not cohort["outliers"].empty:
+                st.subheader("Outlier Answers (|z-score| >= 3)")
+                st.write(cohort["outliers"])
+
+        except Exception as e:
+            st.error(f"Error computing cohort analytics: {e}")
+
     # Check if questions data exists
-    if os.path.exists(questions_file_path):
+    with span("dashboard_questions_data"):
+        questions_data = questions_view(selected_subject)
+    if questions_data is not None:
         try:
-            # Read questions data
-            questions_data = pd.read_csv(questions_file_path, on_bad_lines='skip')
+            # Questions data
             st.subheader("Questions Data")
             st.write(questions_data)
 
@@ -216,6 +245,10 @@ def display_dashboard(selected_subject, selected_date, selected_session, student
     else:
         st.warning("No questions data available.")
 
+    render_seconds = time.perf_counter() - render_start
+    REGISTRY.observe("dashboard_render", render_seconds)
+    st.caption(f"Dashboard rendered in {render_seconds * 1000:.0f} ms")
+
 
 
 
@@ -225,7 +258,17 @@ st.title("Online Exam Portal")
 
 # Sidebar Navigation
 st.sidebar.title("Navigation")
-page = st.sidebar.radio("Go to", ["Faculty Dashboard", "Student Page", "Analytics Dashboard"])
+page = st.sidebar.radio("Go to", ["Faculty Dashboard", "Student Page", "Analytics Dashboard", "Live Monitor", "Admin"],
+                        key="page")
+
+# Append ?profile=1 to the URL to profile this request (and the grading it queues)
+profile_request = st.query_params.get("profile") == "1"
+
+# Background graders: started once per process, shared by all sessions
+get_grading_queue()
+queue_metrics = load_queue_metrics(int(time.time() // config.GRADER_METRICS_TTL))
+st.sidebar.caption(f"Grading queue: {queue_metrics['pending']} pending, {queue_metrics['running']} running, "
+                   f"{queue_metrics['done']} done, {queue_metrics['failed']} failed")
 
 # --- Global Variables ---
 if "questions" not in st.session_state:
@@ -252,37 +295,83 @@ if page == "Faculty Dashboard":
         st.session_state.subject = subject
         st.session_state.date = exam_date.strftime("%Y-%m-%d")
         st.session_state.session = session
-        st.session_state.questions = []
-        st.session_state.answers = []
 
         st.write(f"Subject: {subject}")
         st.write(f"Number of Questions: {num_questions}")
         st.write(f"Date: {st.session_state.date}")
         st.write(f"Session: {session}")
 
-        # Input for Questions and Correct Answers
-        for i in range(num_questions):
-            question = st.text_area(f"Enter Question {i + 1}:")
-            correct_answer = st.text_area(f"Enter Correct Answer for Question {i + 1}:")
-            st.session_state.questions.append(question)
-            st.session_state.answers.append(correct_answer)
-
-        if st.button("Save Questions"):
-            save_questions(subject, num_questions, st.session_state.questions, st.session_state.answers, st.session_state.date, st.session_state.session)
+        # The latest saved version fills the inputs, so a typo in the key
+        # can be fixed without typing the exam again
+        saved = get_exam_registry().lookup(subject, st.session_state.date, session) or \
+            {"questions": [], "correct_answers": []}
+
+        # Inside a form, editing an input does not rerun the page; the
+        # questions are collected once, when the form is submitted
+        with st.form("questions_form"):
+            questions, correct_answers = [], []
+            for i in range(num_questions):
+                questions.append(st.text_area(f"Enter Question {i + 1}:",
+                                              value=saved["questions"][i] if i < len(saved["questions"]) else ""))
+                correct_answers.append(st.text_area(
+                    f"Enter Correct Answer for Question {i + 1}:",
+                    value=saved["correct_answers"][i] if i < len(saved["correct_answers"]) else ""))
+            save_button = st.form_submit_button("Save Questions")
+
+        if save_button:
+            st.session_state.questions = questions
+            st.session_state.answers = correct_answers
+            with st.spinner("Saving questions..."):
+                regrade_report = save_questions(subject, num_questions, st.session_state.questions, st.session_state.answers, st.session_state.date, st.session_state.session)
             st.success("Questions saved successfully! Students can now answer them.")
+            show_regrade_report(regrade_report)
+
+    # Bulk import; Subject/Date/Session columns in the file override the inputs above
+    st.subheader("Import Questions from a File")
+    question_file = st.file_uploader("CSV (Question, Correct Answer) or JSON question set", type=["csv", "json"])
+    if question_file is not None and st.button("Import Questions"):
+        from exam_registry import read_question_file
+
+        try:
+            imported = read_question_file(question_file, question_file.name, subject or None,
+                                          exam_date.strftime("%Y-%m-%d") if exam_date else None, session)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            for exam in imported:
+                with st.spinner(f"Saving {exam['subject']} ({exam['date']}, {exam['session']})..."):
+                    regrade_report = save_questions(exam["subject"], len(exam["questions"]), exam["questions"],
+                                                    exam["correct_answers"], exam["date"], exam["session"],
+                                                    source=question_file.name)
+                st.success(f"Imported {len(exam['questions'])} questions for {exam['subject']} "
+                           f"({exam['date']}, {exam['session']}).")
+                show_regrade_report(regrade_report)
+
+    if subject:
+        versions = get_exam_registry().versions(subject)
+        if versions:
+            import pandas as pd
+
+            with st.expander(f"Question bank for {subject}"):
+                versions_data = pd.DataFrame(versions, columns=["date", "session", "version", "questions", "source",
+                                                                "created_at"])
+                versions_data["created_at"] = pd.to_datetime(versions_data["created_at"], unit="s")
+                st.write(versions_data)
 
 
 
 elif page == "Student Page":
-    if not st.session_state.questions or not st.session_state.subject:
+    # The active exam is shared by all sessions, not taken from this session's state
+    exam = get_exam_registry().active()
+    if not exam or not exam["questions"]:
         st.warning("No questions available at the moment. Please check back later.")
     else:
-        st.header(f"Submit Your Answers for {st.session_state.subject}")
+        st.header(f"Submit Your Answers for {exam['subject']}")
 
         with st.form("answer_form"):
             student_id = st.text_input("Enter your Student ID:")
             answers = []
-            for i, question in enumerate(st.session_state.questions, 1):
+            for i, question in enumerate(exam["questions"], 1):
                 st.write(f"Q{i}: {question}")
                 answer = st.text_area(f"Your Answer for Question {i}")
                 answers.append(answer)
@@ -290,20 +379,24 @@ elif page == "Student Page":
             submit_button = st.form_submit_button(label="Submit Answers")
 
         if submit_button:
-            save_answers(student_id, st.session_state.subject, answers)
-            st.success("Answers submitted successfully!")
-
-            # Plagiarism Detection
-            plagiarism_results = plagiarism_check(answers, st.session_state.answers)
-
-            # NLP Evaluation (Grammar, Coherence)
-            grammar_errors = []
-            for answer in answers:
-                doc = nlp(answer)
-                grammar_errors.append(grammar_check(doc))
-
-            # Save performance data
-            save_performance(student_id, st.session_state.subject, plagiarism_results, grammar_errors, len(answers))
+            with profiled("submit", enabled=profile_request), span("submit"):
+                with span("save_answers"):
+                    save_answers(student_id, exam["subject"], answers, exam["date"], exam["session"])
+
+                # Grading (plagiarism, grammar, saving results) runs in the background
+                # so the submission is acknowledged as soon as it is stored
+                with span("enqueue"):
+                    st.session_state.job_id = enqueue(exam["subject"], student_id, answers, exam["date"],
+                                                      exam["session"], exam["revision"], profile=profile_request)
+            inc("submissions")
+            st.success("Answers submitted successfully! They are being graded.")
+
+        if st.session_state.get("job_id"):
+            job = job_status(st.session_state.job_id)
+            if job:
+                st.info(f"Grading status for {job['student']}: {job['status']}")
+                if st.button("Refresh status"):
+                    st.rerun()
 
 
 # Analytics Dashboard
@@ -317,7 +410,142 @@ elif page == "Analytics Dashboard":
     student_id = st.text_input("Enter Student ID")
 
     if st.button("Show Analytics"):
-        display_dashboard(selected_subject, selected_date.strftime("%Y-%m-%d"), selected_session,student_id)
+        with profiled("dashboard", enabled=profile_request):
+            display_dashboard(selected_subject, selected_date.strftime("%Y-%m-%d"), selected_session,student_id)
+
+    # Whole-cohort gradebook, streamed from the results store to a file
+    with st.expander("Export Gradebook"):
+        from gradebook import FORMATS, export_gradebook
+
+        export_layout = st.radio("Layout:", ["wide", "long"], horizontal=True,
+                                 help="wide: one row per student, long: one row per answer")
+        export_format = st.selectbox("Format:", FORMATS)
+        if st.button("Export"):
+            export_date = selected_date.strftime("%Y-%m-%d")
+            path = f"data/{selected_subject}/exports/{selected_subject}_{export_date}_{selected_session}_{export_layout}.{export_format}"
+            try:
+                with span("gradebook_export"):
+                    report = export_gradebook(selected_subject, path, export_date, selected_session, export_layout)
+            except (LookupError, ValueError) as e:
+                st.warning(str(e))
+            except ImportError as e:
+                st.error(f"{export_format} export needs {e.name}: pip install {e.name}")
+            else:
+                st.success(f"{report['rows']} rows ({report['answers']} answers) exported in {report['seconds']:.1f}s")
+                with open(path, "rb") as f:
+                    st.download_button("Download Gradebook", f, file_name=os.path.basename(path))
+
+
+# Live view of an exam in progress: new results are tailed from the store
+# and folded into running aggregates; the charts are redrawn in place
+elif page == "Live Monitor":
+    import pandas as pd
+    import plotly.express as px
+    from live_monitor import LiveMonitor
+
+    st.header("Live Exam Monitor")
+
+    exam = get_exam_registry().active()
+    subjects = [f for f in os.listdir('data') if os.path.isdir(os.path.join('data', f))] if os.path.exists('data') else []
+    if not subjects:
+        st.warning("No exams yet.")
+        st.stop()
+    selected_subject = st.selectbox("Select Subject:", subjects,
+                                    index=subjects.index(exam["subject"]) if exam and exam["subject"] in subjects else 0)
+    selected_date = st.date_input("Exam Date:", value=datetime.strptime(exam["date"], "%Y-%m-%d").date()
+                                  if exam and exam["subject"] == selected_subject else "today")
+    selected_session = st.selectbox("Select Session:", ["Morning", "Afternoon"],
+                                    index=1 if exam and exam["session"] == "Afternoon" else 0)
+    refresh_seconds = st.slider("Refresh every (seconds):", 1, 30, 2)
+    live = st.checkbox("Live", value=True)
+
+    # One monitor per session and exam, so each refresh reads only the new results
+    monitor_key = (selected_subject, selected_date.strftime("%Y-%m-%d"), selected_session)
+    if st.session_state.get("monitor_key") != monitor_key:
+        st.session_state.monitor = LiveMonitor(*monitor_key)
+        st.session_state.monitor_key = monitor_key
+    monitor = st.session_state.monitor
+
+    summary_placeholder = st.empty()
+    throughput_placeholder = st.empty()
+    questions_placeholder = st.empty()
+    histogram_placeholder = st.empty()
+    alerts_placeholder = st.empty()
+
+    refresh = 0
+    while True:
+        with span("live_monitor_poll"):
+            monitor.poll()
+
+        with summary_placeholder.container():
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Submissions", monitor.submissions)
+            col2.metric("Per minute", f"{monitor.submissions_per_minute():.1f}")
+            col3.metric("Grammar errors per answer", f"{monitor.grammar_total / monitor.answers:.2f}"
+                        if monitor.answers else "-")
+
+        throughput = pd.DataFrame(monitor.throughput(), columns=["minute", "submissions"]).set_index("minute")
+        throughput_placeholder.line_chart(throughput)
+
+        question_summary = pd.DataFrame(monitor.question_summary(), columns=["question", "answers", "mean", "std"])
+        if not question_summary.empty:
+            question_summary["question"] = "q" + question_summary["question"].astype(str)
+            questions_placeholder.plotly_chart(
+                px.bar(question_summary, x="question", y="mean", error_y="std",
+                       title="Mean Plagiarism Score by Question"), key=f"live_questions_{refresh}")
+            histogram_placeholder.plotly_chart(
+                px.bar(x=[f"{i * 10}-{i * 10 + 10}" for i in range(len(monitor.histogram))], y=monitor.histogram,
+                       labels={"x": "Plagiarism score", "y": "Answers"}, title="Plagiarism Score Distribution"),
+                key=f"live_histogram_{refresh}")
+        alerts = monitor.alerts
+        if alerts:
+            alerts_placeholder.dataframe(pd.DataFrame(alerts, columns=["submitted_at", "student", "question", "plagiarism"]))
+        else:
+            # A resubmission may have withdrawn the last alert
+            alerts_placeholder.empty()
+
+        if not live:
+            break
+        refresh += 1
+        time.sleep(refresh_seconds)
+
+
+# Admin: where the time goes on the grading path
+elif page == "Admin":
+    import pandas as pd
+
+    st.header("Grading Metrics")
+
+    # Queue depth and throughput come from the shared queue, so they cover every worker
+    set_gauge("queue_pending", queue_metrics["pending"])
+    set_gauge("queue_running", queue_metrics["running"])
+    set_gauge("submissions_per_min", queue_metrics["throughput_per_min"])
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Queue depth", queue_metrics["pending"] + queue_metrics["running"])
+    col2.metric("Graded per minute", f"{queue_metrics['throughput_per_min']:.1f}")
+    if queue_metrics["latency_p95_s"] is not None:
+        col3.metric("Submit-to-graded p95", f"{queue_metrics['latency_p95_s']:.2f} s")
+
+    eval_cache = get_eval_cache()
+    if eval_cache is not None:
+        cache_stats = eval_cache.stats()
+        set_gauge("eval_cache_hit_rate", cache_stats["hit_rate"])
+        st.subheader("Evaluation Cache")
+        st.write(pd.DataFrame([cache_stats]))
+
+    # Spans recorded by this process (its sessions and its grading workers)
+    st.subheader("Latency by Step (this process)")
+    span_summary = REGISTRY.summary()
+    if span_summary:
+        st.write(pd.DataFrame(span_summary).round(2))
+    else:
+        st.info("No timings recorded yet.")
+    if REGISTRY.counters:
+        st.write(pd.DataFrame(sorted(REGISTRY.counters.items()), columns=["counter", "value"]))
+
+    st.download_button("Download Prometheus metrics", REGISTRY.to_prometheus(), file_name="metrics.prom",
+                       mime="text/plain")
+    st.caption("Add ?profile=1 to the URL to capture a profile of a request into the profiles/ folder.")
 
 # --- End of Main App ---
 
@@ -0,0 +1,84 @@
+# Gradebook export throughput and peak memory on a synthetic results store.
+#
+#   python benchmarks/bench_export.py --students 100000 --questions 10 [--chunk-size 5000]
+#
+# Runs in a temporary directory. Results are written straight into the store
+# (no grading), some students answering fewer questions than others, then
+# every layout and format whose library is installed is exported and timed.
+# Peak memory is the tracemalloc peak of a second, untimed export and should
+# stay flat as --students grows.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gradebook import FORMATS, LAYOUTS, export_gradebook  # noqa: E402
+from results_store import RESULT_COLUMNS, connect  # noqa: E402
+
+
+def fill_store(subject, students, questions, seed):
+    rng = random.Random(seed)
+    conn = connect(subject)
+    try:
+        with conn:
+            for student in range(students):
+                answered = questions if rng.random() > 0.2 else rng.randint(1, questions)
+                conn.executemany(
+                    f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}) VALUES ({', '.join('?' * len(RESULT_COLUMNS))})",
+                    [(f"S{student:06d}", question, "2024-10-19", "Morning", rng.randint(0, 100), rng.randint(0, 5),
+                      "2024-10-19T10:00:00", None, rng.randint(0, 100), rng.randint(0, 100), "[]")
+                     for question in range(1, answered + 1)])
+    finally:
+        conn.close()
+
+
+def run(args):
+    start = time.perf_counter()
+    fill_store("SYN", args.students, args.questions, args.seed)
+    print(f"store: {args.students} students filled in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'layout':<8}{'format':<9}{'rows':>10}{'answers/s':>12}{'MB/s':>8}{'peak MB':>9}")
+    for layout in LAYOUTS:
+        for fmt in FORMATS:
+            path = f"exports/SYN_{layout}.{fmt}"
+            try:
+                report = export_gradebook("SYN", path, layout=layout, chunk_size=args.chunk_size)
+            except ImportError as e:
+                print(f"{layout:<8}{fmt:<9}{'skipped, needs ' + e.name:>39}")
+                continue
+            # Again for the memory peak; tracemalloc slows the export down too much to time it
+            tracemalloc.start()
+            try:
+                export_gradebook("SYN", path, layout=layout, chunk_size=args.chunk_size)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            size = os.path.getsize(path) / 1e6
+            print(f"{layout:<8}{fmt:<9}{report['rows']:>10}{report['answers'] / report['seconds']:>12.0f}"
+                  f"{size / report['seconds']:>8.1f}{peak / 1e6:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            run(args)
+        finally:
+            os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
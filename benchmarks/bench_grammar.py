@@ -0,0 +1,89 @@
+# Per-answer cost of the grammar rules compared with the original POS "X" count.
+#
+#   python benchmarks/bench_grammar.py [--answers 2000] [--min-words 1] [--max-words 80]
+#
+# The model is run once; the checks are then timed over the same docs, and
+# the parse time is added to each so the ratios are end-to-end per-answer
+# latency. The limit is for the full rule set on every answer fully parsed:
+# it must stay under 2x the legacy check. The fast path (short answers only
+# tokenized) is reported separately and is not what the limit is checked on.
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from evaluation import load_nlp  # noqa: E402
+from grammar_rules import count_errors, rule_counts  # noqa: E402
+from metrics import REGISTRY  # noqa: E402
+from preprocess import parse, prepare  # noqa: E402
+from synthetic import perturb, sentence  # noqa: E402
+
+# Latency of the full rule set relative to the legacy check
+MAX_RATIO = 2.0
+
+
+def legacy_grammar_check(doc):
+    return len([token.text for token in doc if token.pos_ == "X"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=2000)
+    parser.add_argument("--min-words", type=int, default=1)
+    parser.add_argument("--max-words", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    answers = [perturb(rng, sentence(rng, args.min_words, args.max_words)) for _ in range(args.answers)]
+    nlp = load_nlp()
+    list(nlp.pipe(answers[:50]))  # warm up
+
+    start = time.perf_counter()
+    full_docs = list(nlp.pipe(answers))
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_docs = [doc for doc, _ in parse(nlp, ((prepare(answer), None) for answer in answers))]
+    fast_parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for doc in full_docs:
+        legacy_grammar_check(doc)
+    legacy_time = parse_time + time.perf_counter() - start
+
+    start = time.perf_counter()
+    for doc in full_docs:
+        count_errors(doc)
+    full_rules_time = parse_time + time.perf_counter() - start
+
+    start = time.perf_counter()
+    for doc in fast_docs:
+        count_errors(doc)
+    fast_rules_time = fast_parse_time + time.perf_counter() - start
+
+    full_ratio = full_rules_time / legacy_time
+    print(f"{'check':<28}{'us/answer':>11}{'ratio':>9}")
+    print(f"{'legacy (pos X)':<28}{1e6 * legacy_time / len(answers):>11.1f}{1:>8.2f}x")
+    print(f"{'all rules, full parse':<28}{1e6 * full_rules_time / len(answers):>11.1f}{full_ratio:>8.2f}x"
+          f"  {'within' if full_ratio <= MAX_RATIO else 'OVER'} the {MAX_RATIO:g}x limit")
+    print(f"{'rules + fast path':<28}{1e6 * fast_rules_time / len(answers):>11.1f}"
+          f"{fast_rules_time / legacy_time:>8.2f}x")
+
+    # Per-rule cost, recorded by rule_counts itself
+    REGISTRY.histograms.clear()
+    for doc in full_docs:
+        rule_counts(doc)
+    print(f"\n{'rule (full parse)':<28}{'us/answer':>11}")
+    for row in REGISTRY.summary():
+        print(f"{row['span'][len('grammar_rule_'):]:<28}{1000 * row['mean_ms']:>11.2f}")
+    if full_ratio > MAX_RATIO:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Stage-by-stage timing of the grading pipeline on a synthetic exam.
+#
+#   python benchmarks/bench_pipeline.py --questions 10 --students 10000 --output bench.json
+#
+# Runs in a temporary directory, so the real data/ folder is never touched,
+# and prints (or writes) a JSON report that can be compared between versions.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_exam  # noqa: E402
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.totals[stage] += time.perf_counter() - start
+        self.calls[stage] += 1
+        return result
+
+    def report(self, students):
+        return {stage: {"total_s": round(total, 6), "calls": self.calls[stage],
+                        "per_student_ms": round(1000 * total / students, 4),
+                        "students_per_s": round(students / total, 2) if total else None}
+                for stage, total in self.totals.items()}
+
+
+def run(args):
+    from aggregates import load_overall, rebuild
+    from answer_io import write_answers
+    from cohort_analytics import cohort_report
+    from evaluation import grammar_check_batch, plagiarism_check, plagiarism_check_batch, save_performance
+    from plagiarism_index import check_peers, save_peers
+    from results_store import load_performance
+
+    subject = args.subject
+    _, correct_answers, submissions = generate_exam(subject, args.questions, args.students, args.min_words,
+                                                    args.max_words, args.copy_rate, args.key_copy_rate,
+                                                    seed=args.seed)
+    nlp = None
+    if not args.skip_nlp:
+        from evaluation import load_nlp
+        nlp = load_nlp()
+
+    timer = Timer()
+    cohort = []
+    for student_id, answers in submissions:
+        # The same steps, in the same order, as a submission through the app
+        timer.time("save_answers", write_answers, subject, student_id, answers, "2024-10-19", "Morning")
+        plagiarism_results = timer.time("plagiarism_check", plagiarism_check, answers, correct_answers)
+        if not args.skip_peers:
+            peers = timer.time("peer_index", check_peers, subject, student_id, answers)
+            timer.time("save_peers", save_peers, subject, student_id, peers)
+        grammar_errors = (timer.time("grammar_check", grammar_check_batch, nlp, answers) if nlp
+                          else [0] * len(answers))
+        # Includes the running-aggregate update done in the same transaction
+        timer.time("save_performance", save_performance, student_id, subject, plagiarism_results, grammar_errors,
+                   len(answers), "2024-10-19", "Morning")
+        if len(cohort) < args.batch_sample:
+            cohort.append(answers)
+
+    if cohort:
+        timer.time("plagiarism_check_batch", plagiarism_check_batch, cohort, correct_answers)
+    timer.time("update_overall_plagiarism (full rebuild)", rebuild, subject)
+    timer.time("dashboard_overall", load_overall, subject, "2024-10-19", "Morning")
+    timer.time("dashboard_student", load_performance, subject, "S000000")
+    timer.time("dashboard_cohort", cohort_report, subject, "2024-10-19", "Morning")
+
+    stages = timer.report(args.students)
+    if cohort:
+        # Only a sample of the cohort is batch-scored; report it per sampled student
+        batch = stages["plagiarism_check_batch"]
+        batch["per_student_ms"] = round(1000 * batch["total_s"] / len(cohort), 4)
+        batch["students_per_s"] = round(len(cohort) / batch["total_s"], 2) if batch["total_s"] else None
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subject", default="SYN")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--min-words", type=int, default=5)
+    parser.add_argument("--max-words", type=int, default=80)
+    parser.add_argument("--copy-rate", type=float, default=0.1)
+    parser.add_argument("--key-copy-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-sample", type=int, default=10000,
+                        help="students scored again with plagiarism_check_batch")
+    parser.add_argument("--skip-nlp", action="store_true", help="skip the spaCy stage (no model needed)")
+    parser.add_argument("--skip-peers", action="store_true", help="skip the cross-student plagiarism index")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    started = time.time()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            stages = run(args)
+        finally:
+            os.chdir(ROOT)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": started,
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "stages": stages,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
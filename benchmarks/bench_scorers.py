@@ -0,0 +1,72 @@
+# Scorer scheduler: CPU-bound (PYTHON) scorers on the thread pool vs. on
+# worker processes, i.e. EXAM_SCORER_PROCESSES=0 vs. > 0.
+#
+#   python benchmarks/bench_scorers.py [--students 1 64 1024] [--questions 10] [--processes 2]
+#
+# Times copy_spans, the built-in PYTHON scorer, with the same scheduler
+# settings as in production for one student (a live submission) and for
+# cohort-sized batches (bulk grading, the grading service). Worker processes
+# are started and warmed up before timing, so only the per-submission cost
+# is compared: pickling the answers and keys, and the workers' own
+# preprocessing caches.
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scorers import ScorerScheduler  # noqa: E402
+from synthetic import perturb, sentence  # noqa: E402
+
+
+def answer(rng, key, key_copy_rate):
+    # Some answers copy the key with a few words changed, so copied spans are found and extended
+    return perturb(rng, key) if rng.random() < key_copy_rate else sentence(rng, 10, 60)
+
+
+def time_batches(scheduler, batches, keys):
+    start = time.perf_counter()
+    for submissions in batches:
+        scheduler.run_batch(submissions, keys, names=["copy_spans"])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, nargs="+", default=[1, 64, 1024])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--answers", type=int, default=2048, help="answers graded per measurement")
+    parser.add_argument("--key-copy-rate", type=float, default=0.2, help="share of answers copied from the key")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keys = [sentence(rng, 30, 60) for _ in range(args.questions)]
+    schedulers = {"threads": ScorerScheduler(processes=0), "processes": ScorerScheduler(processes=args.processes)}
+    try:
+        # Start the workers and fill their key caches
+        for scheduler in schedulers.values():
+            for _ in range(2 * args.processes):
+                scheduler.run_batch([[answer(rng, key, args.key_copy_rate) for key in keys]], keys,
+                                    names=["copy_spans"])
+
+        print(f"{'students':>9}{'batches':>9}{'threads (s)':>13}{'processes (s)':>15}{'speedup':>9}")
+        for num_students in args.students:
+            num_batches = max(1, args.answers // (num_students * args.questions))
+            batches = [[[answer(rng, key, args.key_copy_rate) for key in keys] for _ in range(num_students)]
+                       for _ in range(num_batches)]
+            thread_time = time_batches(schedulers["threads"], batches, keys)
+            process_time = time_batches(schedulers["processes"], batches, keys)
+            print(f"{num_students:>9}{num_batches:>9}{thread_time:>13.3f}{process_time:>15.3f}"
+                  f"{thread_time / process_time:>8.2f}x")
+    finally:
+        for scheduler in schedulers.values():
+            scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main()
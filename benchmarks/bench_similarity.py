@@ -0,0 +1,50 @@
+# Per-pair fuzzywuzzy loop vs. batched rapidfuzz scoring.
+#
+#   python benchmarks/bench_similarity.py [--students 100 1000 10000] [--questions 10]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evaluation import plagiarism_check, plagiarism_check_batch  # noqa: E402
+
+VOCABULARY = ("ai artificial intelligence machine learning data model training health care finance "
+              "fraud detection retail recommendation vehicles assistants decision making problem "
+              "solving language processing vision cleaning transforming missing values errors").split()
+
+
+def random_text(rng, min_words=10, max_words=60):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(min_words, max_words)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keys = [random_text(rng, 30, 60) for _ in range(args.questions)]
+
+    print(f"{'students':>9}{'loop (s)':>11}{'batch (s)':>11}{'speedup':>9}  identical")
+    for num_students in args.students:
+        cohort = [[random_text(rng) for _ in keys] for _ in range(num_students)]
+
+        start = time.perf_counter()
+        looped = [plagiarism_check(answers, keys) for answers in cohort]
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = plagiarism_check_batch(cohort, keys)
+        batch_time = time.perf_counter() - start
+
+        identical = batched.tolist() == looped
+        print(f"{num_students:>9}{loop_time:>11.3f}{batch_time:>11.3f}{loop_time / batch_time:>8.1f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
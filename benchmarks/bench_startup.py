@@ -0,0 +1,55 @@
+# Cold and warm page latency of the Streamlit app.
+#
+#   python benchmarks/bench_startup.py [--runs 5]
+#
+# Each page is measured in a fresh interpreter: the first script run is the
+# cold latency (imports, model load if the page needs it), the following
+# reruns in the same process are the warm latency a user sees on every widget
+# interaction.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app_main.py")
+PAGES = ["Faculty Dashboard", "Student Page", "Analytics Dashboard"]
+
+
+def measure_page(page, runs):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.session_state["page"] = page
+    timings = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return {"page": page, "cold": timings[0], "warm": timings[1:]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="warm reruns per page")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.child:
+        print(json.dumps(measure_page(args.child, args.runs)))
+        return
+
+    print(f"{'page':<22}{'cold (s)':>10}{'warm mean (s)':>15}{'warm max (s)':>14}")
+    for page in PAGES:
+        out = subprocess.run([sys.executable, __file__, "--runs", str(args.runs), "--child", page],
+                             check=True, capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{page:<22}{result['cold']:>10.3f}{statistics.mean(result['warm']):>15.3f}{max(result['warm']):>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Synthetic subjects, questions and student answers for load testing.
+#
+#   python benchmarks/synthetic.py --subject SYN --questions 10 --students 10000 --copy-rate 0.1
+#
+# writes data/SYN/SYN_questions.csv and data/SYN/{student_id}_answers.jsonl
+# in the current directory, exactly as the app would.
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_io import write_answers  # noqa: E402
+
+VOCABULARY = ("ai artificial intelligence machine learning data model training health care finance "
+              "fraud detection retail recommendation vehicles assistants decision making problem "
+              "solving language processing vision cleaning transforming missing values errors "
+              "analysis insight usable format raw organizing correcting handling simulation human "
+              "tasks technologies computer natural smart home devices personalized autonomous").split()
+
+
+def sentence(rng, min_words, max_words):
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+def perturb(rng, text, rate=0.1):
+    # A copied answer with a few words swapped, as copiers tend to do
+    words = text.split()
+    for i in range(len(words)):
+        if rng.random() < rate:
+            words[i] = rng.choice(VOCABULARY)
+    return " ".join(words)
+
+def generate_exam(subject, num_questions=10, num_students=1000, min_words=5, max_words=80,
+                  copy_rate=0.1, key_copy_rate=0.05, date="2024-10-19", session="Morning", seed=0):
+    # Returns (questions, correct_answers, iterator of (student_id, answers));
+    # answers are generated lazily so large cohorts need not fit in memory
+    import pandas as pd
+
+    rng = random.Random(seed)
+    questions = [sentence(rng, 4, 10).rstrip(".") + "?" for _ in range(num_questions)]
+    correct_answers = [sentence(rng, 20, 60) for _ in range(num_questions)]
+    os.makedirs(f"data/{subject}", exist_ok=True)
+    pd.DataFrame({"Question": questions, "Correct Answer": correct_answers,
+                  "Date": [date] * num_questions, "Session": [session] * num_questions}) \
+        .to_csv(f"data/{subject}/{subject}_questions.csv", index=False)
+
+    def submissions():
+        recent = []
+        for n in range(num_students):
+            answers = []
+            for q in range(num_questions):
+                roll = rng.random()
+                if roll < copy_rate and recent:
+                    answers.append(perturb(rng, rng.choice(recent)[q]))
+                elif roll < copy_rate + key_copy_rate:
+                    answers.append(perturb(rng, correct_answers[q]))
+                else:
+                    answers.append(" ".join(sentence(rng, 3, 15)
+                                            for _ in range(max(1, rng.randint(min_words, max_words) // 10))))
+            # Peers to copy from are drawn from a bounded window of earlier students
+            recent = (recent + [answers])[-100:]
+            yield f"S{n:06d}", answers
+
+    return questions, correct_answers, submissions()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subject", default="SYN")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--min-words", type=int, default=5)
+    parser.add_argument("--max-words", type=int, default=80)
+    parser.add_argument("--copy-rate", type=float, default=0.1, help="share of answers copied from another student")
+    parser.add_argument("--key-copy-rate", type=float, default=0.05, help="share of answers copied from the key")
+    parser.add_argument("--date", default="2024-10-19")
+    parser.add_argument("--session", default="Morning")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    _, _, submissions = generate_exam(args.subject, args.questions, args.students, args.min_words, args.max_words,
+                                      args.copy_rate, args.key_copy_rate, args.date, args.session, seed=args.seed)
+    for student_id, answers in submissions:
+        write_answers(args.subject, student_id, answers, args.date, args.session)
+    print(f"data/{args.subject}: {args.questions} questions, {args.students} students")
+
+
+if __name__ == "__main__":
+    main()
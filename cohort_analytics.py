@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from results_store import load_result_arrays
+
+# Cohort-level statistics over every stored result of a subject, optionally
+# restricted to one exam date and session. Results are fetched with a single
+# filtered query into a compact NumPy structured array (see
+# results_store.load_result_arrays) and everything else is vectorized NumPy
+# work; only the small summary tables are built as DataFrames, e.g.
+#
+#   report = cohort_report("AI", date="2024-10-19", session="Morning")
+#   report["questions"]      # per-question mean, median, p90, ... of similarity
+#   report["outliers"]       # answers more than 3 standard deviations off
+
+HISTOGRAM_EDGES = np.linspace(0, 100, 11)
+
+
+def _by_question(results):
+    # [(question, row indexes)] in question order
+    order = np.argsort(results["question"], kind="stable")
+    questions, starts = np.unique(results["question"][order], return_index=True)
+    return list(zip(questions.tolist(), np.split(order, starts[1:])))
+
+def question_stats(results):
+    rows = []
+    for question, rows_of_question in _by_question(results):
+        plagiarism = results["plagiarism"][rows_of_question].astype(np.float64)
+        plagiarism = plagiarism[~np.isnan(plagiarism)]
+        grammar = results["grammar_errors"][rows_of_question].astype(np.float64)
+        has_grammar = not np.isnan(grammar).all()
+        rows.append({
+            "question": question,
+            "count": len(plagiarism),
+            "mean": plagiarism.mean() if len(plagiarism) else np.nan,
+            "median": np.median(plagiarism) if len(plagiarism) else np.nan,
+            "std": plagiarism.std(ddof=1) if len(plagiarism) > 1 else np.nan,
+            "min": plagiarism.min() if len(plagiarism) else np.nan,
+            "max": plagiarism.max() if len(plagiarism) else np.nan,
+            "p90": np.quantile(plagiarism, 0.9) if len(plagiarism) else np.nan,
+            "grammar_errors_mean": np.nanmean(grammar) if has_grammar else np.nan,
+            "grammar_errors_max": np.nanmax(grammar) if has_grammar else np.nan,
+        })
+    return pd.DataFrame(rows, columns=["question", "count", "mean", "median", "std", "min", "max", "p90",
+                                       "grammar_errors_mean", "grammar_errors_max"])
+
+def similarity_histogram(results, edges=HISTOGRAM_EDGES):
+    # Long format: question, bin label, count (empty bins included). Bins are
+    # closed on the right, the first one also on the left.
+    labels = [f"{int(lo)}-{int(hi)}" for lo, hi in zip(edges[:-1], edges[1:])]
+    plagiarism = results["plagiarism"].astype(np.float64)
+    inside = (plagiarism >= edges[0]) & (plagiarism <= edges[-1])
+    bins = np.digitize(plagiarism[inside], edges[1:-1], right=True)
+    rows = []
+    for question, rows_of_question in _by_question(results[inside]):
+        counts = np.bincount(bins[rows_of_question], minlength=len(labels))
+        rows.extend({"question": question, "bin": label, "count": int(count)} for label, count in zip(labels, counts))
+    return pd.DataFrame(rows, columns=["question", "bin", "count"])
+
+def grammar_distribution(results):
+    # How many answers of each question have 0, 1, 2, ... grammar errors
+    errors = np.nan_to_num(results["grammar_errors"].astype(np.float64)).astype(np.int64)
+    values = np.unique(errors)
+    rows = []
+    for question, rows_of_question in _by_question(results):
+        counts = dict(zip(*np.unique(errors[rows_of_question], return_counts=True)))
+        rows.extend({"question": question, "grammar_errors": int(value), "answers": int(counts.get(value, 0))}
+                    for value in values)
+    return pd.DataFrame(rows, columns=["question", "grammar_errors", "answers"])
+
+def outliers(students, results, threshold=3.0):
+    # Answers whose similarity is more than `threshold` standard deviations
+    # from their question's mean (questions with a single answer have no spread)
+    plagiarism = results["plagiarism"].astype(np.float64)
+    z_scores = np.full(len(results), np.nan)
+    for _, rows_of_question in _by_question(results):
+        values = plagiarism[rows_of_question]
+        values = values[~np.isnan(values)]
+        if len(values) > 1:
+            std = values.std(ddof=1)
+            if std > 0:
+                z_scores[rows_of_question] = (plagiarism[rows_of_question] - values.mean()) / std
+    # NaN (no spread) never compares >= threshold
+    flagged = np.flatnonzero(np.abs(z_scores) >= threshold)
+    return pd.DataFrame({
+        "student": [students[code] for code in results["student"][flagged]],
+        "question": results["question"][flagged],
+        "plagiarism": plagiarism[flagged],
+        "grammar_errors": results["grammar_errors"][flagged].astype(np.float64),
+        "z_score": z_scores[flagged],
+    })
+
+def cohort_report(subject, date=None, session=None, z_threshold=3.0):
+    students, results = load_result_arrays(subject, date=date, session=session)
+    return {
+        "students": len(students),
+        "questions": question_stats(results),
+        "histogram": similarity_histogram(results),
+        "grammar": grammar_distribution(results),
+        "outliers": outliers(students, results, z_threshold),
+    }
@@ -0,0 +1,105 @@
+import os
+
+# Settings can be overridden through environment variables so the same code
+# runs on a laptop and on the exam server without edits.
+
+# spaCy model used for grammar checking
+NLP_MODEL = os.environ.get("EXAM_NLP_MODEL", "en_core_web_sm")
+
+# nlp.pipe tuning for batched grading
+NLP_BATCH_SIZE = int(os.environ.get("EXAM_NLP_BATCH_SIZE", "256"))
+NLP_N_PROCESS = int(os.environ.get("EXAM_NLP_N_PROCESS", "1"))
+
+# Cross-student plagiarism index (MinHash + LSH). bands * rows must equal
+# num_perm; with 32 bands of 4 rows, pairs above ~0.42 Jaccard similarity are
+# very likely to become candidates.
+PEER_NUM_PERM = int(os.environ.get("EXAM_PEER_NUM_PERM", "128"))
+PEER_LSH_BANDS = int(os.environ.get("EXAM_PEER_LSH_BANDS", "32"))
+PEER_SHINGLE_SIZE = int(os.environ.get("EXAM_PEER_SHINGLE_SIZE", "3"))
+PEER_TOP_K = int(os.environ.get("EXAM_PEER_TOP_K", "5"))
+
+# Background grading queue (data/grading_queue.sqlite)
+GRADER_WORKERS = int(os.environ.get("EXAM_GRADER_WORKERS", "2"))
+GRADER_MAX_RETRIES = int(os.environ.get("EXAM_GRADER_MAX_RETRIES", "3"))
+# A job left "running" longer than this (crashed worker) is handed out again
+GRADER_LEASE_SECONDS = float(os.environ.get("EXAM_GRADER_LEASE_SECONDS", "300"))
+GRADER_POLL_SECONDS = float(os.environ.get("EXAM_GRADER_POLL_SECONDS", "0.5"))
+# A job the grading service was too busy or slow for is retried after a
+# backoff that doubles each time up to the maximum, and fails after this
+# many such retries
+GRADER_MAX_BUSY_RETRIES = int(os.environ.get("EXAM_GRADER_MAX_BUSY_RETRIES", "10"))
+GRADER_BUSY_BACKOFF_SECONDS = float(os.environ.get("EXAM_GRADER_BUSY_BACKOFF_SECONDS", "1"))
+GRADER_BUSY_BACKOFF_MAX_SECONDS = float(os.environ.get("EXAM_GRADER_BUSY_BACKOFF_MAX_SECONDS", "60"))
+# Window used for the throughput/latency figures, and how long the app
+# reuses them before querying the queue again
+GRADER_METRICS_WINDOW = float(os.environ.get("EXAM_GRADER_METRICS_WINDOW", "300"))
+GRADER_METRICS_TTL = float(os.environ.get("EXAM_GRADER_METRICS_TTL", "5"))
+# Prometheus text file the headless graders (grading_queue.py work,
+# grade.py) rewrite every METRICS_FILE_INTERVAL seconds, e.g. for the
+# node_exporter textfile collector; empty: none
+METRICS_FILE = os.environ.get("EXAM_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("EXAM_METRICS_FILE_INTERVAL", "15"))
+# Finished jobs (and their answers, which the answer files also hold) are
+# deleted this long after they finished; failed ones are kept longer for
+# inspection. Workers purge at most every GRADER_PURGE_INTERVAL seconds.
+GRADER_DONE_RETENTION = float(os.environ.get("EXAM_GRADER_DONE_RETENTION", str(24 * 3600)))
+GRADER_FAILED_RETENTION = float(os.environ.get("EXAM_GRADER_FAILED_RETENTION", str(7 * 24 * 3600)))
+GRADER_PURGE_INTERVAL = float(os.environ.get("EXAM_GRADER_PURGE_INTERVAL", "600"))
+
+# Content-addressed cache of per-answer evaluation results
+EVAL_CACHE_ENABLED = os.environ.get("EXAM_EVAL_CACHE", "1") != "0"
+EVAL_CACHE_PATH = os.environ.get("EXAM_EVAL_CACHE_PATH", "data/eval_cache.sqlite")
+EVAL_CACHE_MAX_ENTRIES = int(os.environ.get("EXAM_EVAL_CACHE_MAX_ENTRIES", "200000"))
+
+# Semantic similarity scoring with word vectors (qN_semantic). Off unless a
+# vectors model is installed, e.g. python -m spacy download en_core_web_md
+SEMANTIC_SCORING = os.environ.get("EXAM_SEMANTIC_SCORING", "0") == "1"
+SEMANTIC_MODEL = os.environ.get("EXAM_SEMANTIC_MODEL", "en_core_web_md")
+
+# Shared local grading service (grading_service.py). When the URL is set,
+# the app's grading workers send jobs there instead of loading a model.
+GRADING_SERVICE_URL = os.environ.get("EXAM_GRADING_SERVICE_URL", "")
+GRADING_SERVICE_HOST = os.environ.get("EXAM_GRADING_SERVICE_HOST", "127.0.0.1")
+GRADING_SERVICE_PORT = int(os.environ.get("EXAM_GRADING_SERVICE_PORT", "8765"))
+# How long the service lets a request wait for grading to start, and then
+# for its batch to be graded, before answering 504; a replica waits longer
+# than both together, so it always gets the service's answer
+GRADING_SERVICE_DEADLINE = float(os.environ.get("EXAM_GRADING_SERVICE_DEADLINE", "20"))
+GRADING_SERVICE_MAX_BATCH_SECONDS = float(os.environ.get("EXAM_GRADING_SERVICE_MAX_BATCH_SECONDS", "60"))
+GRADING_SERVICE_TIMEOUT = float(os.environ.get(
+    "EXAM_GRADING_SERVICE_TIMEOUT", str(GRADING_SERVICE_DEADLINE + GRADING_SERVICE_MAX_BATCH_SECONDS + 10)))
+# Request ids remembered by the service, so a retried request is answered
+# from the first one instead of being graded again
+GRADING_SERVICE_RECENT_JOBS = int(os.environ.get("EXAM_GRADING_SERVICE_RECENT_JOBS", "10000"))
+# Requests graded together in one nlp.pipe, and how long to wait to fill a batch
+GRADING_SERVICE_BATCH = int(os.environ.get("EXAM_GRADING_SERVICE_BATCH", "64"))
+GRADING_SERVICE_MAX_WAIT = float(os.environ.get("EXAM_GRADING_SERVICE_MAX_WAIT", "0.05"))
+# Requests accepted but not yet graded; beyond this the service answers 503
+GRADING_SERVICE_MAX_PENDING = int(os.environ.get("EXAM_GRADING_SERVICE_MAX_PENDING", "1000"))
+
+# Grammar rules (grammar_rules.py). Answers of at most this many words skip
+# the tagger and only get the rules that work on tokens alone.
+GRAMMAR_FAST_PATH_WORDS = int(os.environ.get("EXAM_GRAMMAR_FAST_PATH_WORDS", "3"))
+# Word lists for the spelling rule, separated by os.pathsep; add a file of
+# subject terms so they are not flagged. No readable list turns the rule off.
+GRAMMAR_WORDLISTS = os.environ.get("EXAM_GRAMMAR_WORDLISTS", "/usr/share/dict/words")
+
+# Copied-passage detection (copy_spans.py): runs of at least this many words
+# shared with the answer key are reported as qN_copied_spans, with coverage
+COPY_DETECTION = os.environ.get("EXAM_COPY_DETECTION", "1") != "0"
+COPY_WINDOW_WORDS = int(os.environ.get("EXAM_COPY_WINDOW_WORDS", "5"))
+
+# Answers kept normalized and tokenized by preprocess.prepare, and parsed
+# Docs kept for reuse (these are far larger, so far fewer)
+PREPROCESS_CACHE_SIZE = int(os.environ.get("EXAM_PREPROCESS_CACHE_SIZE", "4096"))
+PREPROCESS_DOC_CACHE_SIZE = int(os.environ.get("EXAM_PREPROCESS_DOC_CACHE_SIZE", "256"))
+
+# Scorer scheduler (scorers.py): threads for scorers that release the GIL,
+# processes for CPU-bound pure-Python ones (0, the default, runs them on the
+# threads too; see benchmarks/bench_scorers.py before raising it), questions
+# per task for scorers that can split the questions, and students per task
+# on the batch paths (bulk grading, the grading service, regrading)
+SCORER_THREADS = int(os.environ.get("EXAM_SCORER_THREADS", str(min(8, os.cpu_count() or 1))))
+SCORER_PROCESSES = int(os.environ.get("EXAM_SCORER_PROCESSES", "0"))
+SCORER_CHUNK_QUESTIONS = int(os.environ.get("EXAM_SCORER_CHUNK_QUESTIONS", "4"))
+SCORER_CHUNK_STUDENTS = int(os.environ.get("EXAM_SCORER_CHUNK_STUDENTS", "256"))
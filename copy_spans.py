@@ -0,0 +1,76 @@
+import json
+from functools import lru_cache
+
+import config
+from preprocess import prepare
+
+# Copied-passage detection for long answers. fuzz.ratio compares whole
+# texts, so one key sentence pasted into a long essay barely moves the
+# score, and its cost grows with the product of the two lengths. Here the
+# key is cut into overlapping windows of COPY_WINDOW_WORDS words that are
+# indexed in a dict; each window of the answer is looked up in it and a hit
+# is extended word by word to the whole copied run, so the work is linear in
+# the length of the answer.
+#
+# Per question this adds, next to qN_plagiarism:
+#   qN_coverage      % of the answer's words that lie in copied spans
+#   qN_key_coverage  % of the key's words that were copied
+#   qN_copied_spans  JSON list of [answer_start, answer_end, key_start, key_end]
+#                    character offsets
+
+# Places in the key a window may occur at that are tried when extending a hit
+MAX_CANDIDATES = 8
+
+
+@lru_cache(maxsize=1024)
+def key_index(key, window):
+    # Built once per key, then shared by every student's answer
+    prepared = prepare(key)
+    key_words, offsets = prepared.words, prepared.offsets
+    index = {}
+    for i in range(len(key_words) - window + 1):
+        index.setdefault(tuple(key_words[i:i + window]), []).append(i)
+    return key_words, offsets, index
+
+
+def copy_check(answer, key, window=config.COPY_WINDOW_WORDS):
+    # (coverage, key_coverage, spans) of one answer against its key
+    key_words, key_offsets, index = key_index(str(key), window)
+    prepared = prepare(answer)
+    answer_words, answer_offsets = prepared.words, prepared.offsets
+    spans, copied_key = [], bytearray(len(key_words))
+    copied_words = 0
+    i = 0
+    while i <= len(answer_words) - window:
+        starts = index.get(tuple(answer_words[i:i + window]))
+        if not starts:
+            i += 1
+            continue
+        # Longest run among the places the window occurs in the key
+        best_start, best_length = starts[0], 0
+        for start in starts[:MAX_CANDIDATES]:
+            length = window
+            while (i + length < len(answer_words) and start + length < len(key_words)
+                   and answer_words[i + length] == key_words[start + length]):
+                length += 1
+            if length > best_length:
+                best_start, best_length = start, length
+        spans.append([answer_offsets[i][0], answer_offsets[i + best_length - 1][1],
+                      key_offsets[best_start][0], key_offsets[best_start + best_length - 1][1]])
+        copied_words += best_length
+        copied_key[best_start:best_start + best_length] = b"\x01" * best_length
+        i += best_length
+
+    coverage = round(100 * copied_words / len(answer_words)) if answer_words else 0
+    key_coverage = round(100 * sum(copied_key) / len(key_words)) if key_words else 0
+    return coverage, key_coverage, spans
+
+def copy_scores(answers, correct_answers, window=config.COPY_WINDOW_WORDS):
+    # One student's extra_scores for the results store
+    coverage, key_coverage, copied_spans = [], [], []
+    for answer, correct_answer in zip(answers, correct_answers):
+        answer_coverage, answer_key_coverage, spans = copy_check(answer, correct_answer, window)
+        coverage.append(answer_coverage)
+        key_coverage.append(answer_key_coverage)
+        copied_spans.append(json.dumps(spans))
+    return {"coverage": coverage, "key_coverage": key_coverage, "copied_spans": copied_spans}
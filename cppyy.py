@@ -1,5 +1,4 @@
 import streamlit as st
-import spacy
 from fuzzywuzzy import fuzz
 import pandas as pd
 import os
@@ -7,8 +6,7 @@ import altair as alt
 from datetime import datetime
 import plotly.express as px
 
-# Load NLP model for grammar check
-nlp = spacy.load('en_core_web_sm')
+from resources import get_nlp
 
 # --- Helper Functions ---
 def save_questions(subject, num_questions, questions, correct_answers, date, session):
@@ -308,7 +306,7 @@ elif page == "Student Page":
             # NLP Evaluation (Grammar, Coherence)
             grammar_errors = []
             for answer in answers:
-                doc = nlp(answer)
+                doc = get_nlp()(answer)
                 grammar_errors.append(grammar_check(doc))
 
             # Save performance data
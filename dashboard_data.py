@@ -0,0 +1,92 @@
+import os
+
+from aggregates import load_overall
+from resources import cache_data
+from results_store import load_results, store_version, to_performance_frame
+
+# Data layer of the Analytics Dashboard. Parsed frames and chart series are
+# cached per (subject, ..., version); the version is the results store's
+# write counter or a file's mtime, so anything save_performance writes is
+# picked up on the next render while repeated clicks cost no I/O.
+
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def _copied_passages(subject, student_id, student_results, date=None, session=None):
+    # One row per answer with passages copied from the key, with the copied
+    # text when the student's answer file belongs to the exam shown
+    import json
+
+    import pandas as pd
+    from answer_io import ANSWERS_SUFFIX, LEGACY_SUFFIX, answer_file_matches, read_answers
+
+    paths = [f"data/{subject}/{student_id}{suffix}" for suffix in (ANSWERS_SUFFIX, LEGACY_SUFFIX)]
+    path = next((path for path in paths if os.path.exists(path)), None)
+    if path and not answer_file_matches(path, date, session):
+        # The latest answers are of another exam; the offsets would point into the wrong text
+        path = None
+    answers = read_answers(path) if path else []
+    rows = []
+    for result in student_results.itertuples():
+        spans = json.loads(result.copied_spans) if isinstance(result.copied_spans, str) else []
+        if not spans:
+            continue
+        answer = answers[result.question - 1] if result.question <= len(answers) else None
+        rows.append({"question": f"q{result.question}", "coverage": result.coverage,
+                     "key_coverage": result.key_coverage,
+                     "copied": " ... ".join(answer[start:end] for start, end, _, _ in spans) if answer else None})
+    return pd.DataFrame(rows) if rows else None
+
+
+@cache_data()
+def _student_view(subject, student_id, date, session, version, peers_mtime):
+    import pandas as pd
+
+    student_results = load_results(subject, student=student_id, date=date, session=session)
+    peers_data = pd.read_csv(f"data/{subject}/{student_id}_peers.csv") if peers_mtime else None
+    if student_results.empty:
+        return {"performance": None, "peers": peers_data}
+    return {
+        "performance": to_performance_frame(subject, student_results),
+        "questions": [f'q{question}' for question in student_results['question']],
+        "plagiarism_scores": student_results['plagiarism'].tolist(),
+        "grammar_errors": student_results['grammar_errors'].tolist(),
+        "peers": peers_data,
+        "copied": _copied_passages(subject, student_id, student_results, date, session),
+    }
+
+def student_view(subject, student_id, date=None, session=None):
+    return _student_view(subject, student_id, date, session, store_version(subject),
+                         _mtime(f"data/{subject}/{student_id}_peers.csv"))
+
+
+@cache_data()
+def _overall_view(subject, date, session, version):
+    return load_overall(subject, date, session) if version else None
+
+def overall_view(subject, date=None, session=None):
+    return _overall_view(subject, date, session, store_version(subject))
+
+
+@cache_data()
+def _cohort_view(subject, date, session, version):
+    from cohort_analytics import cohort_report
+
+    return cohort_report(subject, date, session) if version else None
+
+def cohort_view(subject, date=None, session=None):
+    return _cohort_view(subject, date, session, store_version(subject))
+
+
+@cache_data()
+def _questions_view(subject, mtime):
+    import pandas as pd
+
+    if mtime is None:
+        return None
+    return pd.read_csv(f"data/{subject}/{subject}_questions.csv", on_bad_lines='skip')
+
+def questions_view(subject):
+    return _questions_view(subject, _mtime(f"data/{subject}/{subject}_questions.csv"))
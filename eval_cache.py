@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import config
+import metrics
+
+# Persistent memo of per-answer evaluation results. An entry is addressed by
+# a hash of (scorer version, model version, normalized answer, correct
+# answer), so resubmitted answers and unchanged questions are never scored
+# twice, while a new model or scorer version simply stops matching old
+# entries. Entries also record subject, question and a hash of the correct
+# answer so that editing one question's key drops only that question's rows.
+# Size is bounded; the least recently used entries are evicted first.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    key TEXT PRIMARY KEY,
+    subject TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    key_hash TEXT NOT NULL,
+    similarity INTEGER,
+    grammar_errors INTEGER,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used);
+CREATE INDEX IF NOT EXISTS evaluations_question ON evaluations (subject, question);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Evict down to this fraction of max_entries so eviction is not paid on every write
+EVICT_TO = 0.9
+# How many writes between size checks
+SIZE_CHECK_EVERY = 500
+
+
+def normalize(text):
+    # Only differences that cannot be intended by the student (Unicode
+    # composition, line endings) are folded; anything stronger would change
+    # fuzz.ratio and the spaCy tags and make cached scores wrong
+    return unicodedata.normalize("NFC", text).replace("\r\n", "\n")
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def entry_key(answer, correct_answer, model_version, scorer_version):
+    return text_hash("\x1f".join([scorer_version, model_version, normalize(answer), correct_answer]))
+
+
+class EvaluationCache:
+    def __init__(self, path=config.EVAL_CACHE_PATH, max_entries=config.EVAL_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _count(self, conn, name, amount):
+        if amount:
+            conn.execute("""INSERT INTO counters (name, value) VALUES (?, ?)
+                            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value""", (name, amount))
+
+    def get_many(self, keys):
+        # Returns {key: (similarity, grammar_errors)} for the keys that are cached
+        if not keys:
+            return {}
+        conn = self._connect()
+        try:
+            found = {}
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, similarity, grammar_errors in conn.execute(
+                        f"SELECT key, similarity, grammar_errors FROM evaluations WHERE key IN ({placeholders})", batch):
+                    found[key] = (similarity, grammar_errors)
+            hits = sum(1 for key in keys if key in found)
+            with conn:
+                if found:
+                    now = time.time()
+                    conn.executemany("UPDATE evaluations SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+                self._count(conn, "hits", hits)
+                self._count(conn, "misses", len(keys) - hits)
+        finally:
+            conn.close()
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        metrics.inc("eval_cache_hits", hits)
+        metrics.inc("eval_cache_misses", len(keys) - hits)
+        return found
+
+    def put_many(self, subject, entries):
+        # entries: [(key, question, correct_answer, similarity, grammar_errors)]
+        if not entries:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(key, subject, question, text_hash(correct_answer), similarity, grammar_errors, now)
+                                  for key, question, correct_answer, similarity, grammar_errors in entries])
+            with self._lock:
+                self._writes += len(entries)
+                check = self._writes >= SIZE_CHECK_EVERY
+                if check:
+                    self._writes = 0
+            if check:
+                self._evict(conn)
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            size = conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+            if size <= self.max_entries:
+                return
+            excess = size - int(self.max_entries * EVICT_TO)
+            conn.execute("""DELETE FROM evaluations WHERE key IN
+                            (SELECT key FROM evaluations ORDER BY last_used LIMIT ?)""", (excess,))
+            self._count(conn, "evictions", excess)
+        with self._lock:
+            self.evictions += excess
+
+    def invalidate_changed(self, subject, correct_answers):
+        # Drop the entries of every question whose correct answer is no longer
+        # the one given; other questions keep their cached results
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("DELETE FROM evaluations WHERE subject = ? AND question = ? AND key_hash != ?",
+                                 [(subject, i, text_hash(str(correct_answer)))
+                                  for i, correct_answer in enumerate(correct_answers, 1)])
+                # Questions that were removed altogether
+                conn.execute("DELETE FROM evaluations WHERE subject = ? AND question > ?",
+                             (subject, len(correct_answers)))
+        finally:
+            conn.close()
+
+    def stats(self):
+        # Totals across all processes sharing the cache file
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        finally:
+            conn.close()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {"entries": entries, "max_entries": self.max_entries, "hits": hits, "misses": misses,
+                "evictions": counters.get("evictions", 0),
+                "hit_rate": hits / (hits + misses) if hits + misses else None}
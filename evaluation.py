@@ -0,0 +1,266 @@
+import os
+
+from fuzzywuzzy import fuzz
+
+import config
+from metrics import span
+from answer_io import iter_submissions
+from eval_cache import entry_key
+from grammar_rules import count_errors, rules_version
+from preprocess import parse, prepare
+from plagiarism_index import check_peers, save_peers
+from results_store import save_results
+
+# Pipeline components no scorer reads. The grammar rules only need token.tag_
+# and token.pos_, which en_core_web_sm fills in with tok2vec + tagger +
+# attribute_ruler.
+UNUSED_COMPONENTS = ["parser", "ner", "lemmatizer"]
+
+# Part of every evaluation cache key; bump whenever a scorer's output changes.
+# The grammar rule configuration is added by scorer_version().
+SCORER_VERSION = "3"
+
+
+# --- Model ---
+def load_nlp(model_name=config.NLP_MODEL):
+    import spacy
+
+    # exclude (rather than disable) so the unused weights are never loaded
+    return spacy.load(model_name, exclude=UNUSED_COMPONENTS)
+
+def model_version(nlp):
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}"
+
+def scorer_version():
+    return f"{SCORER_VERSION}-{rules_version()}"
+
+
+# --- Scorers ---
+def plagiarism_check(answers, correct_answers):
+    # Compares the normalized texts (see preprocess.py), not the raw strings
+    plagiarism_results = []
+    for answer, correct_answer in zip(answers, correct_answers):
+        similarity = fuzz.ratio(prepare(answer).normalized, prepare(correct_answer).normalized)
+        plagiarism_results.append(similarity)
+    return plagiarism_results
+
+def plagiarism_check_batch(answers_matrix, correct_answers, workers=-1):
+    # Score a whole cohort at once: answers_matrix is students x questions and
+    # the result is an int array of the same shape on fuzz.ratio's 0-100 scale,
+    # so it can be written straight into the qN_plagiarism columns.
+    # rapidfuzz computes the scores natively on all cores (workers=-1).
+    import numpy as np
+    from rapidfuzz import fuzz as rf_fuzz, process
+
+    answers = np.asarray(answers_matrix, dtype=object)
+    if answers.ndim != 2:
+        raise ValueError("answers_matrix must be two-dimensional (students x questions)")
+    num_students, num_questions = answers.shape
+    if len(correct_answers) < num_questions:
+        raise ValueError(f"{num_questions} questions answered but only {len(correct_answers)} correct answers given")
+    keys = [prepare(key).normalized for key in correct_answers[:num_questions]]
+    if num_students == 0:
+        return np.zeros((0, num_questions), dtype=np.int32)
+    texts = [prepare(answer).normalized for answer in answers.ravel().tolist()]
+
+    if hasattr(process, "cpdist"):
+        # Element-wise pairs (answer, key of its question) in a single call
+        scores = process.cpdist(texts, keys * num_students,
+                                scorer=rf_fuzz.ratio, dtype=np.float64, workers=workers)
+        scores = scores.reshape(num_students, num_questions)
+    else:
+        # rapidfuzz < 3.6: one cdist call per question column
+        scores = np.empty((num_students, num_questions), dtype=np.float64)
+        for j, key in enumerate(keys):
+            scores[:, j] = process.cdist(texts[j::num_questions], [key], scorer=rf_fuzz.ratio,
+                                         dtype=np.float64, workers=workers)[:, 0]
+    # fuzzywuzzy rounds the ratio to the nearest int
+    return np.rint(scores).astype(np.int32)
+
+def grammar_check(doc):
+    # Problems found by all grammar rules (see grammar_rules.py)
+    return count_errors(doc)
+
+def grammar_check_batch(nlp, answers, batch_size=config.NLP_BATCH_SIZE, n_process=1):
+    # Stream answers through nlp.pipe instead of calling nlp() once per answer
+    grammar_errors = [0] * len(answers)
+    for doc, i in parse(nlp, ((prepare(answer), i) for i, answer in enumerate(answers)), batch_size, n_process):
+        grammar_errors[i] = grammar_check(doc)
+    return grammar_errors
+
+
+# --- Grading ---
+def score_answers(subject, answers, correct_answers, nlp, cache=None, scheduler=None, names=None):
+    # One student's answers through the registered scorers (see scorers.py).
+    # Plagiarism and grammar results of answers already seen with the same
+    # key, model and scorers are served from the cache.
+    # Returns ({column: one value per answer}, {scorer: seconds}).
+    if scheduler is None:
+        from resources import get_scorer_scheduler
+        scheduler = get_scorer_scheduler()
+
+    known, keys = {}, []
+    if cache is not None:
+        version, scorers = model_version(nlp), scorer_version()
+        keys = [entry_key(answer, str(correct_answer), version, scorers)
+                for answer, correct_answer in zip(answers, correct_answers)]
+        with span("eval_cache_lookup"):
+            cached = cache.get_many(keys)
+        known = {"plagiarism": {}, "grammar_errors": {}}
+        for i, key in enumerate(keys):
+            if key in cached:
+                known["plagiarism"][i], known["grammar_errors"][i] = cached[key]
+
+    with span("score_answers"):
+        scores, timings = scheduler.run(answers, correct_answers, {"nlp": nlp, "subject": subject}, names, known)
+
+    if cache is not None:
+        scored = [i for i in range(len(keys)) if i not in known["plagiarism"]]
+        with span("eval_cache_store"):
+            cache.put_many(subject, [(keys[i], i + 1, str(correct_answers[i]), scores["plagiarism"][i],
+                                      scores["grammar_errors"][i]) for i in scored])
+    return scores, timings
+
+def evaluate_answers(subject, answers, correct_answers, nlp, cache=None):
+    # (plagiarism_results, grammar_errors) for one student
+    scores, _ = score_answers(subject, answers, correct_answers, nlp, cache, names=["plagiarism", "grammar_errors"])
+    return scores["plagiarism"][:len(correct_answers)], scores["grammar_errors"]
+
+def grade_submission(subject, student_id, answers, correct_answers, date="", session="", nlp=None, cache=None):
+    # Everything the Student Page used to do inline after saving the answers
+    if nlp is None:
+        from resources import get_nlp
+        nlp = get_nlp()
+
+    if cache is None:
+        from resources import get_eval_cache
+        cache = get_eval_cache()
+
+    # Plagiarism Detection, NLP Evaluation (Grammar, Coherence) and every
+    # other registered scorer, run side by side
+    scores, _ = score_answers(subject, answers, correct_answers, nlp, cache)
+    plagiarism_results = scores.pop("plagiarism")[:len(correct_answers)]
+    grammar_errors = scores.pop("grammar_errors")
+
+    finish_submission(subject, student_id, answers, correct_answers, plagiarism_results, grammar_errors, date, session,
+                      extra_scores=scores)
+    return plagiarism_results, grammar_errors
+
+def finish_submission(subject, student_id, answers, correct_answers, plagiarism_results, grammar_errors,
+                      date="", session="", extra_scores=None):
+    # Steps after scoring that need the other students' submissions or the
+    # store. extra_scores: the other scorers' columns (see extra_scores_batch).
+
+    # Cross-student plagiarism: most similar earlier submissions per question
+    with span("peer_index"):
+        save_peers(subject, student_id, check_peers(subject, student_id, answers))
+
+    # Save performance data (includes the overall aggregate update)
+    with span("save_performance"):
+        save_performance(student_id, subject, plagiarism_results, grammar_errors, len(answers), date, session,
+                         extra_scores)
+
+def save_performance(student_id, subject, plagiarism_results, grammar_errors, num_questions, date="", session="",
+                     extra_scores=None):
+    # Append the student's results to the subject's results store; the
+    # overall plagiarism totals are updated in the same transaction
+    save_results(subject, student_id, plagiarism_results[:num_questions], grammar_errors[:num_questions], date, session,
+                 extra_scores=extra_scores)
+
+
+# --- Bulk grading ---
+def _active_exam(subject):
+    from resources import get_exam_registry
+    return get_exam_registry().get(subject)
+
+def load_correct_answers(subject):
+    # From the question bank's in-memory index; the questions CSV is only
+    # read for subjects the bank does not know
+    exam = _active_exam(subject)
+    if exam is not None:
+        return exam["correct_answers"]
+    import pandas as pd
+
+    questions_data = pd.read_csv(f"data/{subject}/{subject}_questions.csv")
+    return questions_data["Correct Answer"].fillna("").tolist()
+
+def load_exam_info(subject):
+    # (date, session) the subject's current questions were set for
+    exam = _active_exam(subject)
+    if exam is not None:
+        return exam["date"], exam["session"]
+    import pandas as pd
+
+    questions_file_path = f"data/{subject}/{subject}_questions.csv"
+    if os.path.exists(questions_file_path):
+        questions_data = pd.read_csv(questions_file_path, on_bad_lines='skip')
+        if not questions_data.empty:
+            return str(questions_data["Date"].iloc[0]), str(questions_data["Session"].iloc[0])
+    return "", ""
+
+def grade_batch(submissions, correct_answers, nlp, batch_size=config.NLP_BATCH_SIZE, n_process=1, workers=-1,
+                subject=None, cache=None):
+    # Grade a list of (student_id, answers) without saving anything.
+    # Returns [(student_id, plagiarism_results, grammar_errors)] in input order.
+
+    # Similarity for all students in one native call; short submissions
+    # are padded and truncated back so results match plagiarism_check
+    num_questions = len(correct_answers)
+    padded = [(answers + [""] * num_questions)[:num_questions] for _, answers in submissions]
+    scores = plagiarism_check_batch(padded, correct_answers, workers=workers) if padded else []
+    results = [(student_id, row[:len(answers)].tolist(), [None] * len(answers))
+               for (student_id, answers), row in zip(submissions, scores)]
+
+    # Grammar counts already in the cache are reused; only the rest is parsed
+    keys = {}
+    if cache is not None:
+        version, scorers = model_version(nlp), scorer_version()
+        keys = {(i, q): entry_key(answer, str(correct_answers[q]), version, scorers)
+                for i, (_, answers) in enumerate(submissions) for q, answer in enumerate(answers[:num_questions])}
+        found = cache.get_many(list(keys.values()))
+        for (i, q), key in keys.items():
+            if key in found:
+                results[i][2][q] = found[key][1]
+
+    # All remaining answers go through a single pipe so batches stay full;
+    # the position of each answer travels alongside its text as context
+    texts = ((prepare(answer), (i, q)) for i, (_, answers) in enumerate(submissions)
+             for q, answer in enumerate(answers) if results[i][2][q] is None)
+    new_entries = []
+    for doc, (i, q) in parse(nlp, texts, batch_size, n_process):
+        results[i][2][q] = grammar_check(doc)
+        if (i, q) in keys:
+            new_entries.append((keys[i, q], q + 1, str(correct_answers[q]), results[i][1][q], results[i][2][q]))
+    if cache is not None:
+        cache.put_many(subject, new_entries)
+    return results
+
+def extra_scores_batch(subject, submissions, correct_answers, scheduler=None):
+    # Every enabled scorer besides plagiarism and grammar (copied passages,
+    # semantic similarity, ...) for a list of answer lists, through the
+    # scorer scheduler. Returns one {column: per-question scores} per student.
+    from scorers import CACHED_SCORERS, enabled_scorers
+
+    names = enabled_scorers(exclude=CACHED_SCORERS)
+    if not names or not submissions:
+        return [{} for _ in submissions]
+    if scheduler is None:
+        from resources import get_scorer_scheduler
+        scheduler = get_scorer_scheduler()
+    with span("extra_scores"):
+        scores, _ = scheduler.run_batch(submissions, correct_answers, {"subject": subject}, names)
+    return [{column: rows[i] for column, rows in scores.items()} for i in range(len(submissions))]
+
+def grade_cohort(subject, correct_answers=None, nlp=None,
+                 batch_size=config.NLP_BATCH_SIZE, n_process=config.NLP_N_PROCESS):
+    # Grade every data/{subject}/*_answers.txt in one call.
+    # Returns {student_id: (plagiarism_results, grammar_errors)}.
+    if correct_answers is None:
+        correct_answers = load_correct_answers(subject)
+    if nlp is None:
+        nlp = load_nlp()
+
+    submissions = sorted(iter_submissions(f"data/{subject}"))
+    return {student_id: (plagiarism_results, grammar_errors)
+            for student_id, plagiarism_results, grammar_errors
+            in grade_batch(submissions, correct_answers, nlp, batch_size, n_process)}
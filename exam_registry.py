@@ -0,0 +1,286 @@
+import glob
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Question bank and active exam, shared by every session, Streamlit worker
+# and process on the host, stored in data/exam_registry.sqlite.
+#
+# Every set of questions saved or imported for a (subject, date, session)
+# becomes a new immutable version in exam_versions; nothing is overwritten,
+# so earlier answer keys stay available (regrade.py diffs against them).
+# The exams table points each subject at its active exam.
+#
+# Each process keeps an in-memory index of the latest version per
+# (subject, date, session) and of the active exam per subject, and one open
+# connection to the registry. A lookup is a dict access after
+# PRAGMA data_version, which SQLite answers without reading any table and
+# which only changes when another connection has committed; the index is
+# re-read only then, and only if the registry's version stamp moved.
+# An empty registry is seeded from the data/*/*_questions.csv files.
+
+REGISTRY_PATH = "data/exam_registry.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    subject TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    questions TEXT NOT NULL,
+    correct_answers TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    published_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exam_versions (
+    subject TEXT NOT NULL,
+    date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    revision INTEGER NOT NULL,  -- 1, 2, ... per (subject, date, session)
+    questions TEXT NOT NULL,
+    correct_answers TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    PRIMARY KEY (subject, date, session, revision)
+);
+CREATE TABLE IF NOT EXISTS registry_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Column names accepted by the bulk importer
+QUESTION_FIELDS = ("question", "Question")
+ANSWER_FIELDS = ("correct_answer", "Correct Answer", "answer")
+EXAM_FIELDS = {"subject": ("subject", "Subject"), "date": ("date", "Date"), "session": ("session", "Session")}
+
+
+def _exam(subject, date, session, questions, correct_answers, revision, source="", created_at=None):
+    return {"subject": subject, "date": date, "session": session, "questions": questions,
+            "correct_answers": correct_answers, "revision": revision, "source": source, "created_at": created_at}
+
+
+class ExamRegistry:
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        # Reentrant: seeding from the CSV files publishes from inside a refresh
+        self._lock = threading.RLock()
+        self._conn = None
+        self._data_version = None
+        self._version = None
+        self._active = None
+        self._exams = {}     # subject -> active exam
+        self._latest = {}    # (subject, date, session) -> latest version
+        self._revisions = {}  # (subject, date, session, revision) -> version, filled on demand
+
+    def _connection(self):
+        # Opened, and the schema created, on first use; callers hold self._lock
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Registries written before versioning: their exams become revision 1
+            with conn:
+                conn.execute("""INSERT OR IGNORE INTO exam_versions
+                                SELECT subject, date, session, 1, questions, correct_answers, 'registry', published_at
+                                FROM exams e WHERE NOT EXISTS (
+                                    SELECT 1 FROM exam_versions v
+                                    WHERE v.subject = e.subject AND v.date = e.date AND v.session = e.session)""")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._data_version = None
+
+    def publish(self, subject, date, session, questions, correct_answers, source="", activate=True):
+        # Store the questions as a new version of the exam (unless they equal
+        # the latest one) and, by default, make it the active exam for
+        # everybody. Returns the revision.
+        questions = json.dumps([str(question) for question in questions])
+        correct_answers = json.dumps([str(answer) for answer in correct_answers])
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                latest = conn.execute("""SELECT revision, questions, correct_answers FROM exam_versions
+                                         WHERE subject = ? AND date = ? AND session = ?
+                                         ORDER BY revision DESC LIMIT 1""", (subject, date, session)).fetchone()
+                now = time.time()
+                if latest and latest[1:] == (questions, correct_answers):
+                    revision = latest[0]
+                else:
+                    revision = latest[0] + 1 if latest else 1
+                    conn.execute("INSERT INTO exam_versions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (subject, date, session, revision, questions, correct_answers, source, now))
+                row = conn.execute("SELECT value FROM registry_meta WHERE name = 'version'").fetchone()
+                version = int(row[0]) + 1 if row else 1
+                meta = [("version", str(version))]
+                if activate:
+                    conn.execute("INSERT OR REPLACE INTO exams VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (subject, date, session, questions, correct_answers, version, now))
+                    meta.append(("active", subject))
+                conn.executemany("INSERT OR REPLACE INTO registry_meta VALUES (?, ?)", meta)
+            # data_version does not move for this connection's own commits
+            self._data_version = None
+        return revision
+
+    def _refresh(self):
+        # Callers hold self._lock
+        conn = self._connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        meta = dict(conn.execute("SELECT name, value FROM registry_meta").fetchall())
+        version = meta.get("version")
+        if version is None:
+            self._seed_from_csv()
+            meta = dict(conn.execute("SELECT name, value FROM registry_meta").fetchall())
+            version = meta.get("version")
+        if version == self._version:
+            self._data_version = data_version
+            return
+        # Only the latest version of each exam is held in memory
+        latest = {}
+        for subject, date, session, revision, questions, correct_answers, source, created_at in conn.execute(
+                """SELECT * FROM exam_versions v WHERE revision = (
+                       SELECT MAX(revision) FROM exam_versions
+                       WHERE subject = v.subject AND date = v.date AND session = v.session)"""):
+            latest[subject, date, session] = _exam(subject, date, session, json.loads(questions),
+                                                   json.loads(correct_answers), revision, source, created_at)
+        exams = {}
+        for subject, date, session, questions, correct_answers, _, published_at in conn.execute("SELECT * FROM exams"):
+            exam = latest.get((subject, date, session))
+            if exam is None or exam["questions"] != json.loads(questions) \
+                    or exam["correct_answers"] != json.loads(correct_answers):
+                # An older revision is active
+                row = conn.execute("""SELECT revision, source FROM exam_versions
+                                      WHERE subject = ? AND date = ? AND session = ?
+                                            AND questions = ? AND correct_answers = ?
+                                      ORDER BY revision DESC LIMIT 1""",
+                                   (subject, date, session, questions, correct_answers)).fetchone()
+                exam = _exam(subject, date, session, json.loads(questions), json.loads(correct_answers),
+                             *(row or (None, "")), created_at=published_at)
+            exams[subject] = exam
+        self._exams, self._latest, self._active, self._version = exams, latest, meta.get("active"), version
+        self._data_version = data_version
+
+    def _seed_from_csv(self):
+        paths = sorted(glob.glob("data/*/*_questions.csv"), key=os.path.getmtime)
+        if not paths:
+            return
+        import pandas as pd
+
+        for path in paths:
+            subject = os.path.basename(os.path.dirname(path))
+            questions_data = pd.read_csv(path, on_bad_lines='skip')
+            if questions_data.empty:
+                continue
+            self.publish(subject, str(questions_data["Date"].iloc[0]), str(questions_data["Session"].iloc[0]),
+                         questions_data["Question"].fillna("").tolist(),
+                         questions_data["Correct Answer"].fillna("").tolist(), source=path)
+
+    def active(self):
+        # The most recently published exam, or None
+        with self._lock:
+            self._refresh()
+            return self._exams.get(self._active)
+
+    def get(self, subject):
+        # The subject's active exam
+        with self._lock:
+            self._refresh()
+            return self._exams.get(subject)
+
+    def lookup(self, subject, date, session):
+        # Latest version of one exam, or None
+        with self._lock:
+            self._refresh()
+            return self._latest.get((subject, date, session))
+
+    def version(self, subject, date, session, revision):
+        # A given version of an exam; versions never change, so they are kept once read
+        key = (subject, date, session, revision)
+        with self._lock:
+            if key not in self._revisions:
+                row = self._connection().execute("""SELECT * FROM exam_versions
+                                                    WHERE subject = ? AND date = ? AND session = ? AND revision = ?""",
+                                                 key).fetchone()
+                if row is None:
+                    return None
+                self._revisions[key] = _exam(row[0], row[1], row[2], json.loads(row[4]), json.loads(row[5]),
+                                             row[3], row[6], row[7])
+            return self._revisions[key]
+
+    def versions(self, subject):
+        # [(date, session, revision, number of questions, source, created_at)], newest first
+        with self._lock:
+            return [(date, session, revision, len(json.loads(questions)), source, created_at)
+                    for date, session, revision, questions, source, created_at in self._connection().execute(
+                        """SELECT date, session, revision, questions, source, created_at FROM exam_versions
+                           WHERE subject = ? ORDER BY created_at DESC, revision DESC""", (subject,))]
+
+
+# --- Bulk import ---
+def _field(record, names):
+    for name in names:
+        value = record.get(name)
+        if value is not None and value == value:  # NaN from empty CSV cells
+            return str(value)
+    return None
+
+def read_question_file(file, name, subject=None, date=None, session=None):
+    # Parse a CSV or JSON question set into exams: [{subject, date, session,
+    # questions, correct_answers}]. file is a path or a binary file object
+    # (e.g. a Streamlit upload); name decides the format. CSV needs Question
+    # and Correct Answer columns, JSON a list of {"question",
+    # "correct_answer"} records or of {"subject", "date", "session",
+    # "questions": [...]} objects. Subject, Date and Session columns/fields
+    # override the given defaults, so one file can hold several exams.
+    if hasattr(file, "read"):
+        data = file.read()
+    else:
+        with open(file, "rb") as f:
+            data = f.read()
+    if name.lower().endswith(".json"):
+        parsed = json.loads(data.decode("utf-8-sig"))
+        parsed = parsed if isinstance(parsed, list) else [parsed]
+        records = []
+        for item in parsed:
+            if isinstance(item, dict) and isinstance(item.get("questions"), list):
+                defaults = {field: _field(item, names) for field, names in EXAM_FIELDS.items()}
+                defaults = {k: v for k, v in defaults.items() if v is not None}
+                # Entries that are not objects are reported below, with their number
+                records.extend({**defaults, **question} if isinstance(question, dict) else question
+                               for question in item["questions"])
+            else:
+                records.append(item)
+    elif name.lower().endswith(".csv"):
+        import pandas as pd
+
+        records = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False).to_dict("records")
+    else:
+        raise ValueError(f"{name}: only .csv and .json question files can be imported")
+
+    defaults = {"subject": subject, "date": date, "session": session}
+    exams = {}
+    for i, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            raise ValueError(f"{name}: entry {i} is not a question record")
+        question, answer = _field(record, QUESTION_FIELDS), _field(record, ANSWER_FIELDS)
+        if question is None or answer is None:
+            raise ValueError(f"{name}: entry {i} needs a question and a correct answer")
+        exam = tuple(_field(record, EXAM_FIELDS[field]) or defaults[field] for field in ("subject", "date", "session"))
+        if not all(exam):
+            raise ValueError(f"{name}: entry {i} has no subject, date or session and no default was given")
+        entry = exams.setdefault(exam, {"subject": exam[0], "date": exam[1], "session": exam[2],
+                                        "questions": [], "correct_answers": []})
+        entry["questions"].append(question)
+        entry["correct_answers"].append(answer)
+    return list(exams.values())
@@ -0,0 +1,123 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import config
+from evaluation import (extra_scores_batch, grade_batch, iter_submissions, load_correct_answers, load_exam_info, load_nlp,
+                        save_performance)
+from metrics import set_gauge, write_prometheus
+from plagiarism_index import check_peers, save_peers
+from resources import get_eval_cache, process_pool
+
+# Headless bulk grading, e.g. for regrading old papers or importing OCR'd
+# answer sets:
+#
+#   python grade.py --subject AI --answers-dir scans/AI --jobs 8
+#
+# Answer files ({student_id}_answers.jsonl, or the older
+# {student_id}_answers.txt) are streamed from disk in chunks; each chunk is graded in a
+# worker process (one spaCy model per worker) while at most two chunks per
+# worker are in flight, so memory stays bounded however many files there
+# are. Results are written by this process into data/{subject}/results.sqlite,
+# the same store the Analytics Dashboard reads.
+
+_worker = {}
+
+
+def _init_worker(subject, correct_answers, batch_size):
+    from scorers import ScorerScheduler
+
+    # The pool already runs one chunk per core, so the other scorers run inline in each worker
+    _worker.update(subject=subject, correct_answers=correct_answers, batch_size=batch_size,
+                   nlp=load_nlp(), cache=get_eval_cache(), scheduler=ScorerScheduler(threads=1, processes=0))
+
+def _grade_chunk(submissions):
+    # Parallelism comes from the process pool, so rapidfuzz stays single-threaded here
+    correct_answers = _worker["correct_answers"]
+    results = grade_batch(submissions, correct_answers, _worker["nlp"], _worker["batch_size"], workers=1,
+                          subject=_worker["subject"], cache=_worker["cache"])
+    # Per-student extra_scores for the results store
+    extra_scores = extra_scores_batch(_worker["subject"], [answers for _, answers in submissions], correct_answers,
+                                      _worker["scheduler"])
+    return results, extra_scores
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def grade_directory(subject, answers_dir=None, correct_answers=None, date=None, session=None,
+                    jobs=None, chunk_size=64, batch_size=config.NLP_BATCH_SIZE, peers=True):
+    # Grade and store every {student_id}_answers.txt in answers_dir.
+    # Yields (graded, elapsed_seconds) after each chunk is saved.
+    answers_dir = answers_dir or f"data/{subject}"
+    if correct_answers is None:
+        correct_answers = load_correct_answers(subject)
+    if date is None or session is None:
+        exam_date, exam_session = load_exam_info(subject)
+        date = exam_date if date is None else date
+        session = exam_session if session is None else session
+    jobs = jobs or os.cpu_count() or 1
+
+    chunks = chunked(iter_submissions(answers_dir), chunk_size)
+    graded = 0
+    start = time.perf_counter()
+    with process_pool(jobs, initializer=_init_worker, initargs=(subject, correct_answers, batch_size)) as pool:
+        pending = {}
+        for chunk in itertools.islice(chunks, 2 * jobs):
+            pending[pool.submit(_grade_chunk, chunk)] = chunk
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                results, extra = future.result()
+                for (student_id, answers), (_, plagiarism_results, grammar_errors), extra_scores \
+                        in zip(chunk, results, extra):
+                    if peers:
+                        save_peers(subject, student_id, check_peers(subject, student_id, answers))
+                    save_performance(student_id, subject, plagiarism_results, grammar_errors, len(answers), date, session,
+                                     extra_scores)
+                graded += len(chunk)
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending[pool.submit(_grade_chunk, next_chunk)] = next_chunk
+                yield graded, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade answer files without the Streamlit app.")
+    parser.add_argument("--subject", required=True)
+    parser.add_argument("--answers-dir", help="directory with {student_id}_answers.jsonl/.txt files (default: data/SUBJECT)")
+    parser.add_argument("--date", help="exam date to store results under (default: from the questions CSV)")
+    parser.add_argument("--session", help="exam session to store results under (default: from the questions CSV)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="students per worker task")
+    parser.add_argument("--batch-size", type=int, default=config.NLP_BATCH_SIZE, help="spaCy nlp.pipe batch size")
+    parser.add_argument("--no-peers", action="store_true", help="skip the cross-student plagiarism index")
+    parser.add_argument("--metrics-file", default=config.METRICS_FILE,
+                        help="Prometheus text file to keep updated with progress and timings (default: EXAM_METRICS_FILE)")
+    args = parser.parse_args(argv)
+
+    graded, elapsed, written = 0, 0.0, 0.0
+    for graded, elapsed in grade_directory(args.subject, args.answers_dir, date=args.date, session=args.session,
+                                           jobs=args.jobs, chunk_size=args.chunk_size,
+                                           batch_size=args.batch_size, peers=not args.no_peers):
+        print(f"\rgraded {graded} students, {graded / elapsed:.1f} students/s", end="", file=sys.stderr, flush=True)
+        if args.metrics_file:
+            set_gauge("bulk_graded", graded)
+            set_gauge("bulk_students_per_s", graded / elapsed)
+            if elapsed - written >= config.METRICS_FILE_INTERVAL:
+                write_prometheus(args.metrics_file)
+                written = elapsed
+    print(file=sys.stderr)
+    if args.metrics_file:
+        write_prometheus(args.metrics_file)
+    print(f"{args.subject}: {graded} students graded in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
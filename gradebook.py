@@ -0,0 +1,232 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+from results_store import EXTRA_COLUMNS, RESULT_COLUMNS, connect, store_path
+
+# Subject-wide gradebook export:
+#
+#   python gradebook.py AI --date 2024-10-19 --session Morning --output AI_gradebook.csv
+#   python gradebook.py AI --layout long --output AI_results.parquet
+#
+# Results are streamed from the subject's results store in chunks and
+# written as they are read, so memory stays bounded by the chunk size however
+# large the cohort. The wide layout has one row per student and exam with
+# q{n}_{score} columns up to the exam's highest question; the header is
+# fixed before the first row is written, so students who answered fewer
+# questions just leave those cells empty. The long layout is one row per
+# answer. CSV needs nothing extra, Parquet needs pyarrow and XLSX openpyxl.
+# Results still in {student_id}_performance.csv files must be moved to the
+# store first with `python results_store.py migrate`.
+
+FORMATS = ("csv", "parquet", "xlsx")
+LAYOUTS = ("wide", "long")
+SCORE_COLUMNS = ["plagiarism", "grammar_errors"] + list(EXTRA_COLUMNS)
+TEXT_COLUMNS = {"subject", "student", "date", "session", "submitted_at", "copied_spans"}
+INTEGER_COLUMNS = {"question", "answered"}
+XLSX_MAX_ROWS = 1048576
+
+
+def _filters(date, session):
+    filters = {"date": date, "session": session}
+    clauses = [f"{column} = ?" for column, value in filters.items() if value is not None]
+    params = [value for value in filters.values() if value is not None]
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _layout(conn, where, params):
+    # (highest question, score columns with any value) of the selected results
+    row = conn.execute(f"SELECT MAX(question), {', '.join(f'COUNT({c})' for c in SCORE_COLUMNS)} FROM results{where}",
+                       params).fetchone()
+    return row[0] or 0, [column for column, count in zip(SCORE_COLUMNS, row[1:]) if count]
+
+def column_name(column):
+    # Result column a gradebook column holds: "q3_copied_spans" -> "copied_spans"
+    prefix, _, score = column.partition("_")
+    return score if prefix[:1] == "q" and prefix[1:].isdigit() and score in SCORE_COLUMNS else column
+
+def wide_header(questions, scores):
+    return (["subject", "student", "date", "session", "submitted_at", "answered", "mean_plagiarism",
+             "total_grammar_errors"]
+            + [f"q{question}_{score}" for question in range(1, questions + 1) for score in scores])
+
+def _wide_rows(subject, rows, questions, scores):
+    # rows: (student, question, date, session, submitted_at, *scores), ordered
+    # by student, date and session; yields one gradebook row per student and exam
+    key, row = None, None
+    width = len(scores)
+    for result in rows:
+        student, question, date, session, submitted_at = result[:5]
+        if (student, date, session) != key:
+            if row is not None:
+                yield _finish(row, scores)
+            key = (student, date, session)
+            row = [subject, student, date, session, submitted_at, 0, None, None] + [None] * (questions * len(scores))
+        base = 8 + (question - 1) * width
+        row[base:base + width] = result[5:]
+        row[5] += 1
+    if row is not None:
+        yield _finish(row, scores)
+
+def _finish(row, scores):
+    # answered, mean_plagiarism and total_grammar_errors from the q columns
+    width = len(scores)
+    for i, score in enumerate(scores):
+        values = [value for value in row[8 + i::width] if value is not None]
+        if score == "plagiarism" and values:
+            row[6] = round(sum(values) / len(values), 2)
+        elif score == "grammar_errors" and values:
+            row[7] = sum(values)
+    return row
+
+
+# --- Writers: write(rows) once per chunk, then close() ---
+class CsvWriter:
+    def __init__(self, path, header):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    def __init__(self, path, header):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string() if column_name(column) in TEXT_COLUMNS else
+                                  pa.int64() if column in INTEGER_COLUMNS else pa.float64())
+                                 for column in header])
+        # One row group per chunk
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+class XlsxWriter:
+    def __init__(self, path, header):
+        from openpyxl import Workbook
+
+        # write_only streams rows to disk instead of keeping the cells in memory
+        self.path = path
+        self.header = header
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.rows = XLSX_MAX_ROWS
+
+    def write(self, rows):
+        for row in rows:
+            if self.rows == XLSX_MAX_ROWS:
+                # A sheet holds at most XLSX_MAX_ROWS rows; continue on a new one
+                self.sheet = self.workbook.create_sheet(f"gradebook{len(self.workbook.worksheets) + 1}")
+                self.sheet.append(self.header)
+                self.rows = 1
+            self.sheet.append(row)
+            self.rows += 1
+
+    def close(self):
+        if self.sheet is None:
+            # No results: still a workbook with the header
+            self.sheet = self.workbook.create_sheet("gradebook1")
+            self.sheet.append(self.header)
+        self.workbook.save(self.path)
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter, "xlsx": XlsxWriter}
+
+
+def export_gradebook(subject, path, date=None, session=None, layout="wide", fmt=None, chunk_size=5000):
+    # Write the subject's results (optionally of one date/session) to path.
+    # fmt defaults to the file extension. Returns {"path", "rows", "answers", "questions", "seconds"}.
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown gradebook format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown gradebook layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    if not os.path.exists(store_path(subject)):
+        raise LookupError(f"{subject} has no stored results")
+
+    start = time.perf_counter()
+    report = {"path": path, "rows": 0, "answers": 0, "questions": 0, "seconds": 0.0}
+    where, params = _filters(date, session)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = connect(subject)
+    try:
+        questions, scores = _layout(conn, where, params)
+        report["questions"] = questions
+        if layout == "wide":
+            header = wide_header(questions, scores)
+            columns = ["student", "question", "date", "session", "submitted_at"] + scores
+        else:
+            header, columns = ["subject"] + RESULT_COLUMNS, RESULT_COLUMNS
+        # Rows of one student and exam are adjacent, and questions in order
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM results{where} "
+                              "ORDER BY student, date, session, question", params)
+        writer = WRITERS[fmt](path, header)
+        complete = False
+        try:
+            def fetched():
+                while rows := cursor.fetchmany(chunk_size):
+                    report["answers"] += len(rows)
+                    yield from rows
+
+            rows = _wide_rows(subject, fetched(), questions, scores) if layout == "wide" else ((subject,) + row for row in fetched())
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    writer.write(chunk)
+                    report["rows"] += len(chunk)
+                    chunk = []
+            if chunk:
+                writer.write(chunk)
+                report["rows"] += len(chunk)
+            complete = True
+        finally:
+            writer.close()
+            if not complete:
+                # No half-written gradebook is left behind
+                os.remove(path)
+    finally:
+        conn.close()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a subject's stored results as one gradebook.")
+    parser.add_argument("subject")
+    parser.add_argument("--date", help="only this exam date (YYYY-MM-DD)")
+    parser.add_argument("--session", help="only this session")
+    parser.add_argument("--layout", choices=LAYOUTS, default="wide",
+                        help="wide: one row per student, long: one row per answer")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the output file extension")
+    parser.add_argument("--output", help="default: data/SUBJECT/exports/SUBJECT_gradebook.csv")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows read and written at a time")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"data/{args.subject}/exports/{args.subject}_gradebook.{args.format or 'csv'}"
+    try:
+        report = export_gradebook(args.subject, output, args.date, args.session, args.layout, args.format,
+                                  args.chunk_size)
+    except (LookupError, ValueError) as e:
+        sys.exit(str(e))
+    except ImportError as e:
+        sys.exit(f"{args.format or output} export needs {e.name}: pip install {e.name}")
+    print(f"{args.subject}: {report['rows']} rows ({report['answers']} answers, {report['questions']} questions) "
+          f"written to {report['path']} in {report['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+import config
+from grading_service import ServiceBusy
+from metrics import REGISTRY, inc, profiled, span
+
+# Durable grading queue. A submission is written to data/grading_queue.sqlite
+# and acknowledged immediately; worker threads (in the Streamlit process or
+# in standalone "python grading_queue.py work" processes) pick the jobs up
+# and run evaluation.grade_submission on them. A job names its exam, not its
+# answer key: the key is looked up in the question bank when the job is
+# graded, so a key corrected while jobs wait in the queue is the one used.
+# Finished jobs are purged after GRADER_DONE_RETENTION (failed ones after
+# GRADER_FAILED_RETENTION), so the table only holds recent work.
+
+QUEUE_PATH = "data/grading_queue.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    student TEXT NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    session TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    busy_retries INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+STATUSES = ["pending", "running", "done", "failed"]
+
+
+def connect(path=QUEUE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "busy_retries" not in existing:
+        conn.execute("ALTER TABLE jobs ADD COLUMN busy_retries INTEGER NOT NULL DEFAULT 0")
+    if "available_at" not in existing:
+        conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL NOT NULL DEFAULT 0")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# --- Producer side ---
+def enqueue(subject, student_id, answers, date="", session="", revision=None, path=QUEUE_PATH, profile=False):
+    # revision: the question bank version the student answered, for the
+    # record. profile=True captures a profile of this job's grading (see metrics.profiled)
+    payload = {"answers": list(answers), "revision": revision}
+    if profile:
+        payload["profile"] = True
+    payload = json.dumps(payload)
+    conn = connect(path)
+    try:
+        with conn:
+            cursor = conn.execute("""INSERT INTO jobs (subject, student, date, session, payload, enqueued_at)
+                                     VALUES (?, ?, ?, ?, ?, ?)""",
+                                  (subject, student_id, date, session, payload, time.time()))
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+def job_status(job_id, path=QUEUE_PATH):
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT id, subject, student, status, attempts, error FROM jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def metrics(path=QUEUE_PATH, window=config.GRADER_METRICS_WINDOW):
+    # Queue depth by status plus throughput and submit-to-graded latency of
+    # the jobs finished during the last `window` seconds
+    conn = connect(path)
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        since = time.time() - window
+        latencies = sorted(row[0] for row in conn.execute(
+            "SELECT finished_at - enqueued_at FROM jobs WHERE status = 'done' AND finished_at >= ?", (since,)))
+    finally:
+        conn.close()
+
+    result = {status: counts.get(status, 0) for status in STATUSES}
+    result["throughput_per_min"] = len(latencies) * 60 / window
+    result["latency_mean_s"] = sum(latencies) / len(latencies) if latencies else None
+    result["latency_p95_s"] = latencies[int(0.95 * (len(latencies) - 1))] if latencies else None
+    return result
+
+
+def purge(conn, done_retention=config.GRADER_DONE_RETENTION, failed_retention=config.GRADER_FAILED_RETENTION):
+    # Delete finished jobs past their retention; returns how many
+    now = time.time()
+    with conn:
+        cursor = conn.execute("""DELETE FROM jobs WHERE (status = 'done' AND finished_at < ?)
+                                                     OR (status = 'failed' AND finished_at < ?)""",
+                              (now - done_retention, now - failed_retention))
+    return cursor.rowcount
+
+
+# --- Consumer side ---
+def claim(conn, lease=config.GRADER_LEASE_SECONDS):
+    # Atomically hand the oldest pending job (or one whose worker died) to
+    # the caller; jobs backing off from a busy grading service wait their turn
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""SELECT * FROM jobs
+                              WHERE (status = 'pending' AND available_at <= ?)
+                                 OR (status = 'running' AND started_at < ?)
+                              ORDER BY id LIMIT 1""", (now, now - lease)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                     (now, row["id"]))
+    return dict(row, attempts=row["attempts"] + 1)
+
+def current_key(job, payload):
+    # (revision, correct answers) of the job's exam as the question bank has it now
+    from resources import get_exam_registry
+
+    exam = get_exam_registry().lookup(job["subject"], job["date"], job["session"])
+    if exam is not None:
+        return exam["revision"], exam["correct_answers"]
+    if "correct_answers" in payload:
+        # Queued before jobs stopped carrying their key
+        return None, payload["correct_answers"]
+    raise LookupError(f"{job['subject']} {job['date']} {job['session']} is not in the question bank")
+
+def process(job):
+    payload = json.loads(job["payload"])
+    profile = payload.pop("profile", False)
+    while True:
+        revision, correct_answers = current_key(job, payload)
+        grade(job, payload["answers"], correct_answers, profile)
+        # The key was corrected while this job was being graded: the regrade
+        # may already have passed this student, so grade again with the new key
+        if current_key(job, payload)[0] == revision:
+            return
+        inc("jobs_regraded")
+
+def grade(job, answers, correct_answers, profile=False):
+    from evaluation import grade_submission
+
+    if config.GRADING_SERVICE_URL:
+        # Thin client: the shared grading service holds the model. Only if it
+        # cannot be reached at all is the job graded here; when it is busy or
+        # slow, ServiceBusy propagates and the job goes back to the queue.
+        # The request id names the job and the key it is graded with, so the
+        # service answers a retried request without grading it again.
+        from eval_cache import text_hash
+        from grading_service import ServiceUnavailable, grade_remote
+        request_id = f"{job['id']}-{job['enqueued_at']}-{text_hash(chr(31).join(map(str, correct_answers)))}"
+        try:
+            grade_remote({"id": request_id, "subject": job["subject"], "student": job["student"], "date": job["date"],
+                          "session": job["session"], "answers": answers, "correct_answers": correct_answers})
+            return
+        except ServiceUnavailable:
+            pass
+    with profiled(f"grade-{job['id']}", enabled=profile), span("grade_submission"):
+        grade_submission(job["subject"], job["student"], answers, correct_answers, job["date"], job["session"])
+
+
+class GradingQueue:
+    def __init__(self, workers=config.GRADER_WORKERS, max_retries=config.GRADER_MAX_RETRIES,
+                 poll_interval=config.GRADER_POLL_SECONDS, path=QUEUE_PATH,
+                 max_busy_retries=config.GRADER_MAX_BUSY_RETRIES, busy_backoff=config.GRADER_BUSY_BACKOFF_SECONDS,
+                 busy_backoff_max=config.GRADER_BUSY_BACKOFF_MAX_SECONDS):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_busy_retries = max_busy_retries
+        self.busy_backoff = busy_backoff
+        self.busy_backoff_max = busy_backoff_max
+        self.poll_interval = poll_interval
+        self.path = path
+        self._stop = threading.Event()
+        self._threads = []
+        self._purged_at = 0.0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"grader-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        conn = connect(self.path)
+        try:
+            while not self._stop.is_set():
+                job = claim(conn)
+                if job is None:
+                    # Idle: drop old finished jobs (one worker per interval does it)
+                    if time.time() - self._purged_at > config.GRADER_PURGE_INTERVAL:
+                        self._purged_at = time.time()
+                        inc("jobs_purged", purge(conn))
+                    self._stop.wait(self.poll_interval)
+                    continue
+                try:
+                    with span("job_processing"):
+                        process(job)
+                except ServiceBusy:
+                    # Backpressure from the grading service: not a failed
+                    # attempt, but retried with a growing backoff and only so often
+                    busy_retries = job["busy_retries"] + 1
+                    if busy_retries > self.max_busy_retries:
+                        inc("jobs_failed")
+                        with conn:
+                            conn.execute("""UPDATE jobs SET status = 'failed', busy_retries = ?, error = ?, finished_at = ?
+                                            WHERE id = ?""",
+                                         (busy_retries, "grading service busy or too slow", time.time(), job["id"]))
+                        continue
+                    inc("grading_service_busy")
+                    backoff = min(self.busy_backoff * 2 ** (busy_retries - 1), self.busy_backoff_max)
+                    with conn:
+                        conn.execute("""UPDATE jobs SET status = 'pending', attempts = attempts - 1, busy_retries = ?,
+                                        available_at = ? WHERE id = ?""",
+                                     (busy_retries, time.time() + backoff, job["id"]))
+                except Exception:
+                    # Retry until max_retries attempts beyond the first one have failed
+                    status = "pending" if job["attempts"] <= self.max_retries else "failed"
+                    inc("jobs_retried" if status == "pending" else "jobs_failed")
+                    with conn:
+                        conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                                     (status, traceback.format_exc(limit=5),
+                                      time.time() if status == "failed" else None, job["id"]))
+                else:
+                    finished_at = time.time()
+                    with conn:
+                        conn.execute("UPDATE jobs SET status = 'done', error = NULL, finished_at = ? WHERE id = ?",
+                                     (finished_at, job["id"]))
+                    # Submit-to-graded latency as seen by the student
+                    REGISTRY.observe("job_latency", finished_at - job["enqueued_at"])
+                    inc("jobs_done")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    # python grading_queue.py work [WORKERS]   run a standalone worker process (metrics in EXAM_METRICS_FILE)
+    # python grading_queue.py status           print queue metrics as JSON
+    # python grading_queue.py purge            delete finished jobs past their retention now
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "work":
+        from metrics import write_prometheus
+
+        queue = GradingQueue(workers=int(sys.argv[2]) if len(sys.argv) > 2 else config.GRADER_WORKERS).start()
+        try:
+            while True:
+                time.sleep(config.METRICS_FILE_INTERVAL if config.METRICS_FILE else 3600)
+                if config.METRICS_FILE:
+                    write_prometheus(config.METRICS_FILE)
+        except KeyboardInterrupt:
+            queue.stop()
+    elif command == "status":
+        print(json.dumps(metrics(), indent=2))
+    elif command == "purge":
+        conn = connect()
+        try:
+            print(f"{purge(conn)} finished jobs deleted")
+        finally:
+            conn.close()
+    else:
+        sys.exit("usage: python grading_queue.py work [WORKERS] | status | purge")
@@ -0,0 +1,295 @@
+import argparse
+import errno
+import json
+import queue
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Local grading service shared by all Streamlit replicas on a host:
+#
+#   python grading_service.py [--host 127.0.0.1] [--port 8765]
+#   EXAM_GRADING_SERVICE_URL=http://127.0.0.1:8765 streamlit run app_main.py
+#
+# One process holds the only warm spaCy model. Requests from all replicas are
+# collected into batches (up to GRADING_SERVICE_BATCH requests or
+# GRADING_SERVICE_MAX_WAIT seconds) and graded with a single nlp.pipe per
+# exam. When GRADING_SERVICE_MAX_PENDING requests are waiting, new ones get
+# 503 so the callers back off instead of piling up. A request whose grading
+# has not started within GRADING_SERVICE_DEADLINE gets 504 and is dropped;
+# one whose batch is still being graded GRADING_SERVICE_MAX_BATCH_SECONDS
+# later gets 504 too, but is finished. Either way the caller requeues it.
+# Requests carry an id: a retry of one the service already holds (waiting,
+# being graded or done) is answered from it rather than graded again.
+#
+#   POST /grade   {"id", "subject", "student", "answers", "correct_answers", "date", "session"}
+#   GET  /health  queue depth and totals
+#   GET  /metrics latency histograms and counters in the Prometheus text format
+
+
+class ServiceBusy(Exception):
+    pass
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ("job", "done", "result", "error", "state", "lock")
+
+    def __init__(self, job):
+        self.job = job
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.state = "waiting"  # -> "grading" or "cancelled"
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Batcher side: False if the request handler already gave up on the job
+        with self.lock:
+            if self.state == "cancelled":
+                return False
+            self.state = "grading"
+            return True
+
+    def cancel(self):
+        # Handler side at the deadline: False if grading has already started
+        with self.lock:
+            if self.state == "grading":
+                return False
+            self.state = "cancelled"
+            return True
+
+
+class GradingService:
+    def __init__(self, batch_size=config.GRADING_SERVICE_BATCH, max_wait=config.GRADING_SERVICE_MAX_WAIT,
+                 max_pending=config.GRADING_SERVICE_MAX_PENDING, recent_jobs=config.GRADING_SERVICE_RECENT_JOBS):
+        from resources import get_eval_cache, get_nlp
+
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue(maxsize=max_pending)
+        # request id -> _Pending of the most recent requests
+        self.recent = OrderedDict()
+        self.recent_jobs = recent_jobs
+        self.recent_lock = threading.Lock()
+        self.nlp = get_nlp()
+        self.cache = get_eval_cache()
+        self.graded = 0
+        self.batches = 0
+        self.rejected = 0
+        self.expired = 0
+        self.duplicates = 0
+        threading.Thread(target=self._run, name="batcher", daemon=True).start()
+
+    def submit(self, job):
+        request_id = job.get("id")
+        with self.recent_lock:
+            pending = self.recent.get(request_id) if request_id is not None else None
+            # A retry: wait for (or reply with) the first request, unless that one was dropped or failed
+            if pending is not None and pending.state != "cancelled" and not pending.error:
+                self.duplicates += 1
+                return pending
+            pending = _Pending(job)
+            try:
+                self.requests.put_nowait(pending)
+            except queue.Full:
+                self.rejected += 1
+                raise ServiceBusy()
+            if request_id is not None:
+                self.recent[request_id] = pending
+                self.recent.move_to_end(request_id)
+                while len(self.recent) > self.recent_jobs:
+                    self.recent.popitem(last=False)
+        return pending
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._grade(batch)
+
+    def _grade(self, batch):
+        from evaluation import extra_scores_batch, finish_submission, grade_batch
+        from metrics import inc, span
+
+        # Requests whose callers timed out are dropped, not graded behind their back
+        started = [pending for pending in batch if pending.start()]
+        self.expired += len(batch) - len(started)
+        inc("service_expired", len(batch) - len(started))
+        batch = started
+        if not batch:
+            return
+        inc("service_batches")
+        inc("service_requests", len(batch))
+
+        # One pipe per exam: requests for the same subject and key go together
+        groups = defaultdict(list)
+        for pending in batch:
+            groups[pending.job["subject"], tuple(pending.job["correct_answers"])].append(pending)
+
+        for (subject, correct_answers), group in groups.items():
+            try:
+                with span("service_grade_batch"):
+                    results = grade_batch([(p.job["student"], p.job["answers"]) for p in group],
+                                          list(correct_answers), self.nlp, subject=subject, cache=self.cache)
+                    extras = extra_scores_batch(subject, [p.job["answers"] for p in group], list(correct_answers))
+            except Exception as e:
+                results, extras = [None] * len(group), [None] * len(group)
+                for pending in group:
+                    pending.error = f"{type(e).__name__}: {e}"
+            for pending, result, extra_scores in zip(group, results, extras):
+                if result is not None:
+                    job = pending.job
+                    _, plagiarism_results, grammar_errors = result
+                    try:
+                        finish_submission(subject, job["student"], job["answers"], job["correct_answers"],
+                                          plagiarism_results, grammar_errors, job.get("date", ""), job.get("session", ""),
+                                          extra_scores)
+                        pending.result = {"plagiarism": plagiarism_results, "grammar_errors": grammar_errors}
+                        self.graded += 1
+                    except Exception as e:
+                        pending.error = f"{type(e).__name__}: {e}"
+                # Only the result is kept for retries
+                pending.job = None
+                pending.done.set()
+        self.batches += 1
+
+    def health(self):
+        return {"status": "ok", "pending": self.requests.qsize(), "graded": self.graded, "batches": self.batches,
+                "rejected": self.rejected, "expired": self.expired, "duplicates": self.duplicates}
+
+
+def make_handler(service, deadline, max_batch_seconds):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, service.health())
+            elif self.path == "/metrics":
+                from metrics import REGISTRY, set_gauge
+
+                set_gauge("service_pending", service.requests.qsize())
+                data = REGISTRY.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/grade":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                for field in ("subject", "student", "answers", "correct_answers"):
+                    if field not in job:
+                        raise ValueError(f"missing field {field!r}")
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+                return
+            try:
+                pending = service.submit(job)
+            except ServiceBusy:
+                self._reply(503, {"error": "grading queue full"}, {"Retry-After": "1"})
+                return
+            if not pending.done.wait(deadline):
+                if pending.cancel():
+                    # Never graded: the caller puts the job back in its queue
+                    self._reply(504, {"error": "grading did not start in time"})
+                    return
+                # Grading has started; it is finished even if this reply
+                # gives up, and the caller's retry gets its result
+                if not pending.done.wait(max_batch_seconds):
+                    self._reply(504, {"error": "grading is taking too long"})
+                    return
+            if pending.error:
+                self._reply(500, {"error": pending.error})
+            else:
+                self._reply(200, pending.result)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# --- Client ---
+def _unreachable(reason):
+    # Nothing was delivered: the service is down or the host cannot be reached
+    return isinstance(reason, (ConnectionRefusedError, socket.gaierror)) or \
+        getattr(reason, "errno", None) in (errno.ECONNREFUSED, errno.ENETUNREACH, errno.EHOSTUNREACH)
+
+def grade_remote(job, url=None, timeout=config.GRADING_SERVICE_TIMEOUT):
+    # Raises ServiceUnavailable only when the service cannot be reached at
+    # all, so the caller may grade the job itself. Load shedding (503), a
+    # deadline reply (504) and timeouts raise ServiceBusy: the service may
+    # still hold the job, so it must be requeued rather than graded here
+    # too. A requeued job is sent again with the same "id", which the
+    # service answers without grading it twice.
+    url = url or config.GRADING_SERVICE_URL
+    request = urllib.request.Request(f"{url.rstrip('/')}/grade", data=json.dumps(job).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        if e.code in (503, 504):
+            raise ServiceBusy() from e
+        raise RuntimeError(f"grading service error {e.code}: {e.read().decode('utf-8', 'replace')}") from e
+    except urllib.error.URLError as e:
+        if _unreachable(e.reason):
+            raise ServiceUnavailable(str(e.reason)) from e
+        raise ServiceBusy() from e
+    except OSError as e:
+        # Timeouts and connections dropped mid-request included
+        if _unreachable(e):
+            raise ServiceUnavailable(str(e)) from e
+        raise ServiceBusy() from e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared local grading service.")
+    parser.add_argument("--host", default=config.GRADING_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.GRADING_SERVICE_PORT)
+    args = parser.parse_args(argv)
+
+    service = GradingService()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, config.GRADING_SERVICE_DEADLINE,
+                                                                      config.GRADING_SERVICE_MAX_BATCH_SECONDS))
+    print(f"grading service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+
+import config
+from metrics import REGISTRY
+
+# Grammar and coherence rules that run over the Doc the grader has already
+# parsed, so they cost no extra pass through the model. Each rule counts the
+# problems it finds in one answer:
+#
+#   unknown_pos    tokens the tagger could not place (POS "X"), the original check
+#   agreement      subject-verb and determiner-noun number ("they goes", "these result")
+#   article        "a" before a vowel, "an" before a consonant
+#   fragment       sentences of FRAGMENT_MIN_WORDS+ words without a verb
+#   repeated_word  the same word twice in a row ("the the")
+#   common_error   phrases that are always wrong ("could of", "alot")
+#   spelling       words missing from the configured word lists
+#
+# Rules that read tags are skipped on tokenizer-only docs, the fast path for
+# very short answers (see preprocess.parse). The time spent in each rule is
+# recorded as a grammar_rule_<name> span.
+
+FRAGMENT_MIN_WORDS = 4
+SENTENCE_END = {".", "!", "?"}
+
+AGREEMENT_PATTERNS = {
+    "third_person_base_verb": [[{"LOWER": {"IN": ["he", "she", "it"]}}, {"TAG": "VBP"}]],
+    "plural_subject_s_verb": [[{"LOWER": {"IN": ["i", "you", "we", "they"]}}, {"TAG": "VBZ"}]],
+    "singular_det_plural_noun": [[{"LOWER": {"IN": ["a", "an", "this", "that", "each", "every", "another"]}},
+                                  {"TAG": "NNS"}]],
+    "plural_det_singular_noun": [[{"LOWER": {"IN": ["these", "those", "many", "several", "both"]}},
+                                  {"TAG": "NN"}]],
+}
+# "u" and "h" are left out: "a university", "an hour"
+ARTICLE_PATTERNS = {
+    "a_before_vowel": [[{"LOWER": "a"}, {"IS_ALPHA": True, "LOWER": {"REGEX": "^[aeio]"}}]],
+    "an_before_consonant": [[{"LOWER": "an"}, {"IS_ALPHA": True, "LOWER": {"REGEX": "^[bcdfgjklmnpqrstvwxz]"}}]],
+}
+COMMON_ERRORS = ["could of", "should of", "would of", "must of", "might of", "alot", "irregardless",
+                 "supposably", "for all intensive purposes", "could care less", "per say"]
+# Legitimately doubled words
+REPEATABLE = {"had", "that", "is", "very", "so"}
+
+
+# --- Shared state ---
+_lock = threading.Lock()
+_matchers = {}  # id(vocab) -> (vocab, {rule: matcher})
+_vocabulary = None
+_version = None
+
+def matchers(vocab):
+    # Built once per vocabulary, i.e. once per loaded model
+    entry = _matchers.get(id(vocab))
+    if entry is not None and entry[0] is vocab:
+        return entry[1]
+    from spacy.matcher import Matcher, PhraseMatcher
+    from spacy.tokens import Doc
+
+    with _lock:
+        built = {}
+        for rule, patterns in (("agreement", AGREEMENT_PATTERNS), ("article", ARTICLE_PATTERNS)):
+            built[rule] = Matcher(vocab)
+            for key, pattern in patterns.items():
+                built[rule].add(key, pattern)
+        built["common_error"] = PhraseMatcher(vocab, attr="LOWER")
+        built["common_error"].add("COMMON_ERROR", [Doc(vocab, words=phrase.split()) for phrase in COMMON_ERRORS])
+        _matchers[id(vocab)] = (vocab, built)
+    return built
+
+def vocabulary():
+    # Lower-cased words of every readable word list; empty when there is none
+    global _vocabulary
+    if _vocabulary is None:
+        with _lock:
+            if _vocabulary is None:
+                words = set()
+                for path in filter(None, config.GRAMMAR_WORDLISTS.split(os.pathsep)):
+                    if os.path.exists(path):
+                        with open(path, encoding="utf-8", errors="ignore") as f:
+                            words.update(line.strip().lower() for line in f)
+                words.discard("")
+                _vocabulary = frozenset(words)
+    return _vocabulary
+
+
+# --- Rules ---
+def unknown_pos(doc):
+    return sum(1 for token in doc if token.pos_ == "X")
+
+def agreement(doc):
+    return len(matchers(doc.vocab)["agreement"](doc))
+
+def article(doc):
+    return len(matchers(doc.vocab)["article"](doc))
+
+def fragment(doc):
+    # No sentence segmenter is loaded, so sentences end at . ! ?
+    count, words, has_verb = 0, 0, False
+    for token in doc:
+        if token.text in SENTENCE_END:
+            count += words >= FRAGMENT_MIN_WORDS and not has_verb
+            words, has_verb = 0, False
+        elif not (token.is_punct or token.is_space):
+            words += 1
+            has_verb = has_verb or token.pos_ in ("VERB", "AUX")
+    return count + (words >= FRAGMENT_MIN_WORDS and not has_verb)
+
+def repeated_word(doc):
+    return sum(1 for token in doc[1:]
+               if token.is_alpha and token.lower_ == doc[token.i - 1].lower_ and token.lower_ not in REPEATABLE)
+
+def common_error(doc):
+    return len(matchers(doc.vocab)["common_error"](doc))
+
+def spelling(doc):
+    words = vocabulary()
+    if not words:
+        return 0
+    tagged = doc.has_annotation("POS")
+    # Names are not spelling mistakes; untagged docs fall back to capitalisation
+    return sum(1 for token in doc
+               if token.is_alpha and len(token) > 2 and token.lower_ not in words
+               and not (token.pos_ == "PROPN" if tagged else token.is_title and token.i > 0))
+
+
+# (name, rule, needs tags)
+RULES = [
+    ("unknown_pos", unknown_pos, True),
+    ("agreement", agreement, True),
+    ("article", article, False),
+    ("fragment", fragment, True),
+    ("repeated_word", repeated_word, False),
+    ("common_error", common_error, False),
+    ("spelling", spelling, False),
+]
+RULE_NAMES = [name for name, _, _ in RULES]
+
+
+def rule_counts(doc):
+    # {rule: problems found}; rules needing tags report 0 on tokenizer-only docs
+    tagged = doc.has_annotation("TAG")
+    counts = {}
+    for name, rule, needs_tags in RULES:
+        if needs_tags and not tagged:
+            counts[name] = 0
+            continue
+        start = time.perf_counter()
+        counts[name] = rule(doc)
+        REGISTRY.observe(f"grammar_rule_{name}", time.perf_counter() - start)
+    return counts
+
+def count_errors(doc):
+    return sum(rule_counts(doc).values())
+
+def rules_version():
+    # Hash of everything the counts depend on besides the code and the
+    # model: the rule set and its patterns, the fast-path threshold and the
+    # contents of the word lists. Part of the evaluation cache key, so
+    # changing EXAM_GRAMMAR_WORDLISTS or EXAM_GRAMMAR_FAST_PATH_WORDS (or a
+    # word list file) stops serving cached counts. Computed once per process.
+    global _version
+    if _version is None:
+        digest = hashlib.sha256()
+        for part in (RULE_NAMES, AGREEMENT_PATTERNS, ARTICLE_PATTERNS, COMMON_ERRORS, sorted(REPEATABLE),
+                     FRAGMENT_MIN_WORDS, config.GRAMMAR_FAST_PATH_WORDS):
+            digest.update(repr(part).encode("utf-8"))
+        for word in sorted(vocabulary()):
+            digest.update(word.encode("utf-8") + b"\n")
+        _version = digest.hexdigest()[:16]
+    return _version
@@ -0,0 +1,128 @@
+import math
+import os
+from collections import deque
+
+from aggregates import HISTOGRAM_BINS, histogram_bin
+from results_store import connect, store_path
+
+# Live view of an exam while it is being written. A LiveMonitor tails the
+# subject's results store: every row carries the store version of the write
+# that stored it (seq), so each poll reads only the rows graded since the
+# previous one, through the seq index, and folds them into running
+# aggregates. Besides those, only each student's latest scores of the exam
+# are kept, so a poll costs the same after ten thousand submissions as after
+# ten. A resubmission replaces the student's earlier answers: their scores
+# are taken out of the aggregates and their alerts dropped before the new
+# ones are added. Scores changed in place by regrade.py, and rows stored
+# before results had a seq column, are not picked up.
+
+ALERT_THRESHOLD = 80  # plagiarism score at which an answer is listed as an alert
+
+
+class LiveMonitor:
+    def __init__(self, subject, date=None, session=None, window_minutes=30, alerts=20, chunk_size=5000):
+        self.subject = subject
+        self.date = date
+        self.session = session
+        self.window_minutes = window_minutes
+        self.chunk_size = chunk_size
+        self.cursor = 0
+        self.submissions = 0  # students who submitted
+        self.answers = 0
+        self.latest = {}  # (student, date, session) -> {question: (plagiarism, grammar_errors)}
+        self.question_stats = {}  # question -> [count, total, total_sq]
+        self.grammar_total = 0
+        self.histogram = [0] * HISTOGRAM_BINS
+        self.per_minute = {}  # "YYYY-MM-DD HH:MM" -> submissions, only the last window_minutes
+        self._alerts = deque(maxlen=alerts)  # ((student, date, session), alert), newest first
+
+    def poll(self):
+        # Fold the rows written since the last poll into the aggregates.
+        # Returns (new submissions, new answers); resubmissions count too.
+        if not os.path.exists(store_path(self.subject)):
+            return 0, 0
+        filters = {"date": self.date, "session": self.session}
+        clauses = "".join(f" AND {column} = ?" for column, value in filters.items() if value is not None)
+        params = [value for value in filters.values() if value is not None]
+        conn = connect(self.subject)
+        try:
+            cursor = conn.execute(f"""SELECT seq, student, date, session, question, plagiarism, grammar_errors,
+                                             submitted_at
+                                      FROM results WHERE seq > ?{clauses} ORDER BY seq""",
+                                  [self.cursor] + params)
+            new_submissions = new_answers = 0
+            while rows := cursor.fetchmany(self.chunk_size):
+                for seq, student, date, session, question, plagiarism, grammar_errors, submitted_at in rows:
+                    if seq != self.cursor:
+                        # First row of the next submission
+                        self.cursor = seq
+                        new_submissions += 1
+                        minute = (submitted_at or "")[:16].replace("T", " ")
+                        self.per_minute[minute] = self.per_minute.get(minute, 0) + 1
+                        scores = self._replace(student, date, session)
+                    new_answers += 1
+                    scores[question] = (plagiarism, grammar_errors)
+                    self._add(question, plagiarism, grammar_errors, 1)
+                    if plagiarism is not None and plagiarism >= ALERT_THRESHOLD:
+                        self._alerts.appendleft(((student, date, session), (submitted_at, student, question, plagiarism)))
+        finally:
+            conn.close()
+        self._trim_window()
+        return new_submissions, new_answers
+
+    def _replace(self, student, date, session):
+        # The student's scores of this exam, emptied; earlier ones leave the aggregates
+        key = (student, date, session)
+        previous = self.latest.get(key)
+        if previous is None:
+            self.submissions += 1
+        else:
+            for question, (plagiarism, grammar_errors) in previous.items():
+                self._add(question, plagiarism, grammar_errors, -1)
+            self._alerts = deque(((alert_key, alert) for alert_key, alert in self._alerts if alert_key != key),
+                                 maxlen=self._alerts.maxlen)
+        scores = self.latest[key] = {}
+        return scores
+
+    def _add(self, question, plagiarism, grammar_errors, sign):
+        # sign 1 adds an answer to the aggregates, -1 takes it out again
+        self.answers += sign
+        self.grammar_total += sign * (grammar_errors or 0)
+        if plagiarism is None:
+            return
+        stats = self.question_stats.setdefault(question, [0, 0.0, 0.0])
+        stats[0] += sign
+        stats[1] += sign * plagiarism
+        stats[2] += sign * plagiarism * plagiarism
+        if not stats[0]:
+            del self.question_stats[question]
+        self.histogram[histogram_bin(plagiarism)] += sign
+
+    def _trim_window(self):
+        if len(self.per_minute) <= self.window_minutes:
+            return
+        for minute in sorted(self.per_minute)[:-self.window_minutes]:
+            del self.per_minute[minute]
+
+    # --- Views for the monitor page ---
+    @property
+    def alerts(self):
+        # [(submitted_at, student, question, plagiarism)], newest first
+        return [alert for _, alert in self._alerts]
+
+    def question_summary(self):
+        # [(question, answers, mean, std)] in question order
+        rows = []
+        for question, (count, total, total_sq) in sorted(self.question_stats.items()):
+            mean = total / count
+            rows.append((question, count, mean, math.sqrt(max(total_sq / count - mean * mean, 0.0))))
+        return rows
+
+    def throughput(self):
+        # [(minute, submissions)] for the last window_minutes, oldest first
+        return sorted(self.per_minute.items())
+
+    def submissions_per_minute(self):
+        # Average over the last five minutes that saw submissions
+        minutes = self.throughput()[-5:]
+        return sum(count for _, count in minutes) / len(minutes) if minutes else 0.0
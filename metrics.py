@@ -0,0 +1,159 @@
+import bisect
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process timing spans, counters and gauges for the grading hot path.
+#
+#   with span("grammar_check"):
+#       ...
+#
+# Span durations go into fixed-bucket latency histograms, so recording is
+# O(1) and memory does not grow with traffic. The registry can be rendered
+# in the Prometheus text format (the Admin page offers it for download, the
+# grading service serves it on /metrics and the headless graders write it
+# to EXAM_METRICS_FILE). profiled() captures a
+# cProfile (or pyinstrument, if installed) report for a single request.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_DIR = "profiles"
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        # Estimated by linear interpolation inside the bucket holding the quantile
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started_at = time.time()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def summary(self):
+        # One row per span: count, mean and estimated percentiles in ms
+        with self._lock:
+            return [{"span": name, "count": h.count, "mean_ms": 1000 * h.total / h.count,
+                     "p50_ms": 1000 * h.quantile(0.5), "p95_ms": 1000 * h.quantile(0.95),
+                     "p99_ms": 1000 * h.quantile(0.99), "total_s": h.total}
+                    for name, h in sorted(self.histograms.items()) if h.count]
+
+    def to_prometheus(self, prefix="exam"):
+        out = io.StringIO()
+        with self._lock:
+            out.write(f"# TYPE {prefix}_span_seconds histogram\n")
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for upper, count in zip(BUCKETS + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if upper == float("inf") else repr(upper)
+                    out.write(f'{prefix}_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}\n')
+                out.write(f'{prefix}_span_seconds_sum{{span="{name}"}} {h.total}\n')
+                out.write(f'{prefix}_span_seconds_count{{span="{name}"}} {h.count}\n')
+            for name, value in sorted(self.counters.items()):
+                out.write(f"# TYPE {prefix}_{name}_total counter\n{prefix}_{name}_total {value}\n")
+            for name, value in sorted(self.gauges.items()):
+                if value is not None:
+                    out.write(f"# TYPE {prefix}_{name} gauge\n{prefix}_{name} {value}\n")
+        return out.getvalue()
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def span(name, registry=REGISTRY):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start)
+
+def inc(name, amount=1):
+    REGISTRY.inc(name, amount)
+
+def set_gauge(name, value):
+    REGISTRY.set_gauge(name, value)
+
+def write_prometheus(path):
+    # Replaced atomically, so a scraper never reads a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(REGISTRY.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def profiled(name, enabled=True):
+    # Profile the enclosed block and write the report to profiles/
+    if not enabled:
+        yield
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = f"{PROFILE_DIR}/{time.strftime('%Y%m%d-%H%M%S')}-{name}-{threading.get_ident()}"
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with open(f"{path}.txt", "w") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+    else:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(f"{path}.html", "w") as f:
+                f.write(profiler.output_html())
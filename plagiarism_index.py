@@ -0,0 +1,132 @@
+import os
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+import config
+from preprocess import prepare
+from resources import cache_resource
+
+# Cross-student plagiarism detection. Each question of a subject has its own
+# MinHash index; signatures are appended to data/{subject}/minhash/q{n}.idx
+# so every process (and every Streamlit worker) sees the same submissions.
+# A new answer is compared only against the peers that share at least one
+# LSH band with it instead of against every earlier submission.
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = 0xFFFFFFFF
+
+# Fixed seed: signatures written by one process must be comparable with
+# signatures computed by any other
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 31, size=config.PEER_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=config.PEER_NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text, size=config.PEER_SHINGLE_SIZE):
+    words = prepare(text).words
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash(text):
+    # Returns None for answers without any words; those are never indexed
+    tokens = shingles(text)
+    if not tokens:
+        return None
+    hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    permuted = ((hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+class MinHashIndex:
+    def __init__(self, path, bands=config.PEER_LSH_BANDS):
+        if config.PEER_NUM_PERM % bands:
+            raise ValueError(f"num_perm ({config.PEER_NUM_PERM}) must be divisible by bands ({bands})")
+        self.path = path
+        self.bands = bands
+        self.rows = config.PEER_NUM_PERM // bands
+        self.signatures = {}
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+        self._offset = 0
+        # Shared by every Streamlit session thread of the process
+        self.lock = threading.Lock()
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, student_id, signature):
+        previous = self.signatures.get(student_id)
+        if previous is not None:
+            # Resubmission: drop the stale buckets first
+            for band, key in enumerate(self._band_keys(previous)):
+                self.buckets[band][key].discard(student_id)
+        self.signatures[student_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band][key].add(student_id)
+
+    def refresh(self):
+        # Pick up signatures appended since the last read, by this or any other process
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written record, read it next time
+                self._offset += len(line)
+                student_id, hex_signature = line.decode("utf-8").rstrip("\n").split("\t")
+                self._insert(student_id, np.frombuffer(bytes.fromhex(hex_signature), dtype="<u4"))
+
+    def add(self, student_id, signature):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        record = f"{student_id}\t{signature.astype('<u4').tobytes().hex()}\n".encode("utf-8")
+        # A single O_APPEND write keeps concurrent writers from interleaving
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+        self.refresh()
+
+    def query(self, signature, k=config.PEER_TOP_K, exclude=None):
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates |= self.buckets[band].get(key, set())
+        candidates.discard(exclude)
+        # Fraction of equal MinHash values estimates the Jaccard similarity
+        scored = [(peer, int(round(100 * np.mean(self.signatures[peer] == signature)))) for peer in candidates]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:k]
+
+
+@cache_resource
+def get_index(subject, question):
+    return MinHashIndex(f"data/{subject}/minhash/q{question}.idx")
+
+
+def check_peers(subject, student_id, answers, k=config.PEER_TOP_K):
+    # Compare each answer against all earlier submissions for the same
+    # question, then add it to the index. Returns rows of
+    # (question, peer, similarity) with similarity on the 0-100 scale.
+    rows = []
+    for i, answer in enumerate(answers, 1):
+        signature = minhash(answer)
+        if signature is None:
+            continue
+        index = get_index(subject, i)
+        with index.lock:
+            index.refresh()
+            for peer, similarity in index.query(signature, k, exclude=student_id):
+                rows.append((f"q{i}", peer, similarity))
+            index.add(student_id, signature)
+    return rows
+
+def save_peers(subject, student_id, rows):
+    import pandas as pd
+
+    # Stored next to {student_id}_performance.csv
+    peers = pd.DataFrame(rows, columns=["question", "peer", "similarity"])
+    peers.to_csv(f"data/{subject}/{student_id}_peers.csv", index=False)
@@ -0,0 +1,93 @@
+import functools
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import config
+
+# One preprocessing stage shared by every scorer. An answer is normalized
+# and tokenized once into a PreparedAnswer:
+#
+#   text        whitespace runs collapsed to single spaces; what the parser
+#               and the word-vector model see
+#   words       NFKC-normalized, case-folded word tokens without punctuation
+#   offsets     (start, end) of each word in the original answer
+#   normalized  the words joined by single spaces; what similarity scorers
+#               compare, so "Ai is used in Health care,   and logistics"
+#               matches "AI is used in health care and logistics"
+#
+# prepare() is memoized: the similarity, copy-span and peer scorers that
+# look at the same answer share one object. PreparedAnswers are immutable,
+# so threads can share them freely. Parsed spaCy Docs are much larger and
+# are kept apart, in a small LRU of their own (PREPROCESS_DOC_CACHE_SIZE),
+# so a Doc parsed for an answer is reused by identical answers without
+# pinning thousands of parsed essays in every process.
+
+WORD = re.compile(r"\w+")
+
+
+class PreparedAnswer:
+    __slots__ = ("text", "words", "offsets", "normalized")
+
+    def __init__(self, raw):
+        self.text = " ".join(raw.split())
+        matches = list(WORD.finditer(raw))
+        if raw.isascii():
+            self.words = tuple(match.group().lower() for match in matches)
+        else:
+            self.words = tuple(unicodedata.normalize("NFKC", match.group()).casefold() for match in matches)
+        self.offsets = tuple(match.span() for match in matches)
+        self.normalized = " ".join(self.words)
+
+
+@functools.lru_cache(maxsize=config.PREPROCESS_CACHE_SIZE)
+def prepare(raw):
+    return PreparedAnswer(str(raw))
+
+def tokenizer_only(answer):
+    # Answers short enough for the tokenizer-only fast path
+    return len(answer.words) <= config.GRAMMAR_FAST_PATH_WORDS
+
+
+# --- Parsed Docs ---
+_docs = OrderedDict()  # text -> (nlp, doc), least recently used first
+_docs_lock = threading.Lock()
+
+def _cached_doc(nlp, text):
+    with _docs_lock:
+        entry = _docs.get(text)
+        if entry is None or entry[0] is not nlp:
+            return None
+        _docs.move_to_end(text)
+        return entry[1]
+
+def _remember_doc(nlp, text, doc):
+    if config.PREPROCESS_DOC_CACHE_SIZE <= 0:
+        return
+    with _docs_lock:
+        _docs[text] = (nlp, doc)
+        _docs.move_to_end(text)
+        while len(_docs) > config.PREPROCESS_DOC_CACHE_SIZE:
+            _docs.popitem(last=False)
+
+def parse(nlp, items, batch_size=config.NLP_BATCH_SIZE, n_process=1):
+    # (PreparedAnswer, context) pairs -> (Doc parsed by nlp, context), not in
+    # input order. Recently parsed texts are reused and very short answers
+    # are only tokenized; the rest share one nlp.pipe so its batches stay full.
+    ready = []
+
+    def to_parse():
+        for answer, context in items:
+            doc = _cached_doc(nlp, answer.text)
+            if doc is None and tokenizer_only(answer):
+                doc = nlp.make_doc(answer.text)
+            if doc is not None:
+                ready.append((doc, context))
+            else:
+                yield answer.text, (answer.text, context)
+
+    for doc, (text, context) in nlp.pipe(to_parse(), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        _remember_doc(nlp, text, doc)
+        yield doc, context
+    yield from ready
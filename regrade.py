@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+
+from aggregates import apply_rescore
+from answer_io import iter_submissions
+from metrics import span
+from results_store import bump_version, connect, store_path
+from scorers import SCORERS, enabled_scorers
+
+# Re-scoring stored results after the answer key was corrected:
+#
+#   python regrade.py AI                        # against the previous version in the question bank
+#   python regrade.py AI --previous old_key.csv
+#
+# save_questions does this by itself when an exam is saved again. Only
+# questions whose correct answer changed are scored again, with every score
+# that depends on the key; grammar counts do not and are left alone. Only
+# answer files recorded for the exam's date and session are read: a
+# student's file holds their latest submission in the subject, and one for
+# another exam (or from before files recorded the exam) is skipped. Stored
+# answers are streamed in chunks; each chunk is scored by every key-dependent
+# scorer through the scorer scheduler (scorers.py), and its rows and the
+# aggregates are updated in place in one short transaction, so live
+# submissions are never blocked for long.
+
+
+def load_key(path):
+    # (correct answers, date, session) of a questions CSV
+    import pandas as pd
+
+    questions_data = pd.read_csv(path, on_bad_lines='skip')
+    if questions_data.empty:
+        return [], "", ""
+    return (questions_data["Correct Answer"].fillna("").tolist(),
+            str(questions_data["Date"].iloc[0]), str(questions_data["Session"].iloc[0]))
+
+def changed_questions(old_answers, new_answers):
+    # Numbers (from 1) of the questions in both keys whose correct answer differs.
+    # Added questions have no stored answers yet; removed ones are left as they are.
+    return [i for i, (old, new) in enumerate(zip(old_answers, new_answers), 1) if str(old) != str(new)]
+
+
+def regrade(subject, questions, correct_answers, date="", session="", answers_dir=None, chunk_size=500, scheduler=None):
+    # Re-score the given questions of every stored answer of the exam.
+    # Returns {"questions", "students", "records", "seconds"}.
+    report = {"questions": list(questions), "students": 0, "records": 0, "seconds": 0.0}
+    if not questions or not os.path.exists(store_path(subject)):
+        return report
+
+    start = time.perf_counter()
+    columns = [question - 1 for question in questions]
+    if scheduler is None:
+        from resources import get_scorer_scheduler
+        scheduler = get_scorer_scheduler()
+    # Every stored score that depends on the key
+    names = enabled_scorers(key_only=True)
+    score_columns = [column for name in names for column in SCORERS[name].columns]
+    update = (f"UPDATE results SET {', '.join(f'{column} = ?' for column in score_columns)} "
+              "WHERE student = ? AND question = ? AND date = ? AND session = ?")
+
+    submissions = iter_submissions(answers_dir or f"data/{subject}", date, session)
+    conn = connect(subject)
+    try:
+        with span("regrade"):
+            while chunk := list(itertools.islice(submissions, chunk_size)):
+                # {column: [scores per question] per student}, only the changed
+                # questions scored; unanswered ones are skipped below
+                scores, _ = scheduler.run_batch([answers for _, answers in chunk], correct_answers,
+                                                {"subject": subject}, names, questions=columns)
+
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    changes, students = [], set()
+                    for s, (student_id, answers) in enumerate(chunk):
+                        for question, column in zip(questions, columns):
+                            if column >= len(answers):
+                                continue
+                            old = conn.execute("""SELECT plagiarism FROM results
+                                                  WHERE student = ? AND question = ? AND date = ? AND session = ?""",
+                                               (student_id, question, date, session)).fetchone()
+                            if old is None:
+                                # Answer file without graded results for this exam
+                                continue
+                            conn.execute(update, [scores[name][s][column] for name in score_columns]
+                                         + [student_id, question, date, session])
+                            changes.append((question, old[0], scores["plagiarism"][s][column]))
+                            students.add(student_id)
+                    apply_rescore(conn, date, session, changes)
+                    if changes:
+                        bump_version(conn)
+                report["students"] += len(students)
+                report["records"] += len(changes)
+    finally:
+        conn.close()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def regrade_changed(subject, previous_path=None, **kwargs):
+    # Diff the subject's active answer key against an earlier one (a
+    # questions CSV, or else the exam's previous version in the question
+    # bank) and re-score only what changed. A CSV for another date or
+    # session is a new exam rather than a correction, so nothing is re-scored then.
+    from resources import get_exam_registry
+
+    registry = get_exam_registry()
+    exam = registry.get(subject)
+    if exam is None:
+        raise LookupError(f"{subject} has no exam in the question bank")
+    correct_answers, date, session = exam["correct_answers"], exam["date"], exam["session"]
+    if previous_path:
+        if not os.path.exists(previous_path):
+            raise LookupError(f"no questions file at {previous_path}")
+        old_answers, old_date, old_session = load_key(previous_path)
+        if (old_date, old_session) != (date, session):
+            return regrade(subject, [], correct_answers, date, session)
+    else:
+        previous = registry.version(subject, date, session, (exam["revision"] or 1) - 1)
+        if previous is None:
+            raise LookupError(f"{subject} {date} {session} has no earlier version to compare with")
+        old_answers = previous["correct_answers"]
+    return regrade(subject, changed_questions(old_answers, correct_answers), correct_answers, date, session, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored results after the answer key changed.")
+    parser.add_argument("subject")
+    parser.add_argument("--previous", help="earlier questions CSV (default: the previous version in the question bank)")
+    parser.add_argument("--answers-dir", help="directory with the answer files (default: data/SUBJECT)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="students per transaction")
+    args = parser.parse_args(argv)
+
+    try:
+        report = regrade_changed(args.subject, args.previous, answers_dir=args.answers_dir, chunk_size=args.chunk_size)
+    except LookupError as e:
+        sys.exit(str(e))
+    if not report["questions"]:
+        print(f"{args.subject}: no changed questions, nothing to re-grade")
+        return
+    print(f"{args.subject}: questions {', '.join(map(str, report['questions']))} re-graded, "
+          f"{report['records']} records of {report['students']} students updated in {report['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import functools
+import sys
+
+import config
+
+
+# Shared, process-wide resources. Inside the Streamlit app they are held by
+# st.cache_resource so every session and every rerun reuses one copy; in
+# plain Python processes (CLI, workers, benchmarks) a memoizing cache is used
+# instead so streamlit is never imported just for this.
+def cache_resource(func):
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        return st.cache_resource(show_spinner=False)(func)
+    return functools.lru_cache(maxsize=None)(func)
+
+
+def cache_data(max_entries=256):
+    # Like cache_resource, for data derived from files; callers pass a
+    # version (store version, file mtime) as an argument so a new version
+    # is a different cache entry
+    def decorator(func):
+        if "streamlit" in sys.modules:
+            import streamlit as st
+            return st.cache_data(max_entries=max_entries, show_spinner=False)(func)
+        return functools.lru_cache(maxsize=max_entries)(func)
+    return decorator
+
+
+@cache_resource
+def get_nlp(model_name=config.NLP_MODEL):
+    # Loaded on first use, i.e. when the first answer is graded
+    from evaluation import load_nlp
+    return load_nlp(model_name)
+
+
+@cache_resource
+def get_grading_queue():
+    # One pool of background graders per process, started on first use
+    from grading_queue import GradingQueue
+    return GradingQueue().start()
+
+
+@cache_resource
+def get_eval_cache():
+    # None when the evaluation cache is switched off (EXAM_EVAL_CACHE=0)
+    if not config.EVAL_CACHE_ENABLED:
+        return None
+    from eval_cache import EvaluationCache
+    return EvaluationCache()
+
+
+@cache_resource
+def get_exam_registry():
+    from exam_registry import ExamRegistry
+    return ExamRegistry()
+
+
+@cache_resource
+def get_scorer_scheduler():
+    # Thread and process pools shared by every grading worker of the process
+    from scorers import ScorerScheduler
+    return ScorerScheduler()
+
+
+def process_pool(max_workers, initializer=None, initargs=()):
+    # Worker processes for CPU-bound grading. Forked workers would inherit
+    # the parent's threads and the locks they hold (grading queue, scorer
+    # threads, SQLite connections) and can deadlock, so they are started
+    # from a clean forkserver (spawn where there is none) and import what
+    # they need themselves
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method),
+                               initializer=initializer, initargs=initargs)
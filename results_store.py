@@ -0,0 +1,249 @@
+import glob
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+import aggregates
+
+# Graded results of a subject live in one SQLite file,
+# data/{subject}/results.sqlite, with one row per (student, question, date,
+# session) instead of one {student_id}_performance.csv per student. Readers
+# filter in SQL so only the rows they need are ever loaded.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    student TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    date TEXT NOT NULL DEFAULT '',
+    session TEXT NOT NULL DEFAULT '',
+    plagiarism INTEGER,
+    grammar_errors INTEGER,
+    submitted_at TEXT,
+    seq INTEGER,  -- store version of the write that stored the row, for tailing
+    PRIMARY KEY (student, question, date, session)
+);
+-- the primary key already serves lookups by student
+CREATE INDEX IF NOT EXISTS results_question ON results (question);
+-- also answers MIN/MAX of a question's scores when aggregates are corrected
+CREATE INDEX IF NOT EXISTS results_exam ON results (date, session, question, plagiarism);
+-- bumped by every write so readers can cache by version
+CREATE TABLE IF NOT EXISTS store_meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Optional per-question scores, added to existing stores on first connect.
+# Written as q{n}_{name} columns in the wide performance layout.
+EXTRA_COLUMNS = {
+    "semantic": "INTEGER",
+    # copied passages, see copy_spans.py
+    "coverage": "INTEGER",
+    "key_coverage": "INTEGER",
+    "copied_spans": "TEXT",
+}
+
+RESULT_COLUMNS = ["student", "question", "date", "session", "plagiarism", "grammar_errors",
+                  "submitted_at"] + list(EXTRA_COLUMNS)
+
+PERFORMANCE_COLUMN = re.compile(r"^q(\d+)_(plagiarism|grammar_errors)$")
+
+
+def store_path(subject):
+    return f"data/{subject}/results.sqlite"
+
+def connect(subject):
+    if not os.path.exists(f'data/{subject}'):
+        os.makedirs(f'data/{subject}')
+    conn = sqlite3.connect(store_path(subject), timeout=30)
+    # WAL lets dashboards read while submissions are being written
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    conn.executescript(aggregates.SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+    for column, column_type in EXTRA_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE results ADD COLUMN {column} {column_type}")
+    if "seq" not in existing:
+        conn.execute("ALTER TABLE results ADD COLUMN seq INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS results_seq ON results (seq)")
+    return conn
+
+
+# --- Writing ---
+def bump_version(conn):
+    # Returns the new version
+    conn.execute("""INSERT INTO store_meta (name, value) VALUES ('version', 1)
+                    ON CONFLICT (name) DO UPDATE SET value = value + 1""")
+    return conn.execute("SELECT value FROM store_meta WHERE name = 'version'").fetchone()[0]
+
+def _native(value):
+    # sqlite3 cannot bind NumPy scalars; NaN becomes NULL
+    if value is None or value != value:
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+def _at(scores, index):
+    return scores[index] if scores is not None and index < len(scores) else None
+
+def save_results(subject, student_id, plagiarism_results, grammar_errors, date="", session="", submitted_at=None,
+                 extra_scores=None):
+    # extra_scores: {column in EXTRA_COLUMNS: per-question scores}
+    submitted_at = submitted_at or datetime.now().isoformat(timespec="seconds")
+    extra_scores = extra_scores or {}
+    rows = [(student_id, i, date, session, _native(plagiarism), _native(grammar), submitted_at)
+            + tuple(_native(_at(extra_scores.get(column), i - 1)) for column in EXTRA_COLUMNS)
+            for i, (plagiarism, grammar) in enumerate(zip(plagiarism_results, grammar_errors), 1)]
+    conn = connect(subject)
+    try:
+        with conn:
+            # Take the write lock before reading so concurrent submissions serialize
+            conn.execute("BEGIN IMMEDIATE")
+            previous = dict(conn.execute("SELECT question, plagiarism FROM results WHERE student = ? AND date = ? AND session = ?",
+                                         (student_id, date, session)).fetchall())
+            # A resubmission replaces the student's previous answers for this exam
+            conn.execute("DELETE FROM results WHERE student = ? AND date = ? AND session = ?",
+                         (student_id, date, session))
+            # Rows carry the version of this write, so tailing readers find new rows by seq
+            seq = bump_version(conn)
+            conn.executemany(f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}, seq) "
+                             f"VALUES ({', '.join('?' * len(RESULT_COLUMNS))}, ?)", [row + (seq,) for row in rows])
+            aggregates.apply_submission(conn, date, session, previous, {row[1]: row[4] for row in rows})
+    finally:
+        conn.close()
+
+
+# --- Reading ---
+def store_version(subject):
+    # 0 while the subject has no store yet
+    if not os.path.exists(store_path(subject)):
+        return 0
+    conn = connect(subject)
+    try:
+        row = conn.execute("SELECT value FROM store_meta WHERE name = 'version'").fetchone()
+        return row[0] if row else 0
+    finally:
+        conn.close()
+
+def load_results(subject, student=None, question=None, date=None, session=None):
+    # Long format: one row per student and question, filtered in SQL
+    import pandas as pd
+
+    filters = {"student": student, "question": question, "date": date, "session": session}
+    clauses = [f"{column} = ?" for column, value in filters.items() if value is not None]
+    params = [value for value in filters.values() if value is not None]
+    query = f"SELECT {', '.join(RESULT_COLUMNS)} FROM results"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY student, question"
+
+    if not os.path.exists(store_path(subject)):
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    conn = connect(subject)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+def load_result_arrays(subject, date=None, session=None, chunk_size=10000):
+    # Compact alternative to load_results for large cohorts: returns
+    # (students, array) where array is a NumPy structured array with one
+    # row per answer and its "student" field indexes into students. Rows
+    # are fetched in chunks, so no per-row Python objects pile up.
+    import numpy as np
+
+    dtype = np.dtype([("student", np.int32), ("question", np.int32),
+                      ("plagiarism", np.float32), ("grammar_errors", np.float32)])
+    students, codes, chunks = [], {}, []
+    if not os.path.exists(store_path(subject)):
+        return students, np.zeros(0, dtype=dtype)
+
+    filters = {"date": date, "session": session}
+    clauses = [f"{column} = ?" for column, value in filters.items() if value is not None]
+    query = "SELECT student, question, plagiarism, grammar_errors FROM results"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    conn = connect(subject)
+    try:
+        cursor = conn.execute(query + " ORDER BY student, question",
+                              [value for value in filters.values() if value is not None])
+        while rows := cursor.fetchmany(chunk_size):
+            chunk = np.empty(len(rows), dtype=dtype)
+            for i, (student, question, plagiarism, grammar_errors) in enumerate(rows):
+                code = codes.get(student)
+                if code is None:
+                    code = codes[student] = len(students)
+                    students.append(student)
+                chunk[i] = (code, question, np.nan if plagiarism is None else plagiarism,
+                            np.nan if grammar_errors is None else grammar_errors)
+            chunks.append(chunk)
+    finally:
+        conn.close()
+    return students, np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+
+def to_performance_frame(subject, results):
+    # Wide layout of the old {student_id}_performance.csv files:
+    # subject, student, q1_plagiarism, q1_grammar_errors, ...
+    import pandas as pd
+
+    rows = []
+    for student, student_results in results.groupby("student", sort=False):
+        row = {"subject": subject, "student": student}
+        for result in student_results.itertuples():
+            row[f"q{result.question}_plagiarism"] = result.plagiarism
+            row[f"q{result.question}_grammar_errors"] = result.grammar_errors
+            for column in EXTRA_COLUMNS:
+                value = getattr(result, column)
+                if value is not None and value == value:
+                    row[f"q{result.question}_{column}"] = value
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def load_performance(subject, student, date=None, session=None):
+    return to_performance_frame(subject, load_results(subject, student=student, date=date, session=session))
+
+
+# --- Migration from the per-student CSV layout ---
+def migrate_subject(subject, remove=False):
+    import pandas as pd
+
+    from evaluation import load_exam_info
+
+    date, session = load_exam_info(subject)
+
+    migrated = 0
+    for path in sorted(glob.glob(f"data/{subject}/*_performance.csv")):
+        performance_data = pd.read_csv(path)
+        submitted_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+        for record in performance_data.to_dict("records"):
+            student_id = str(record.get("student", os.path.basename(path)[:-len("_performance.csv")]))
+            scores = {}
+            for column, value in record.items():
+                match = PERFORMANCE_COLUMN.match(column)
+                if match:
+                    scores.setdefault(int(match.group(1)), {})[match.group(2)] = value
+            questions = sorted(scores)
+            save_results(subject, student_id,
+                         [scores[q].get("plagiarism") for q in questions],
+                         [scores[q].get("grammar_errors") for q in questions],
+                         date, session, submitted_at)
+            migrated += 1
+        if remove:
+            os.remove(path)
+    return migrated
+
+def migrate_all(remove=False):
+    if not os.path.exists("data"):
+        return {}
+    return {subject: migrate_subject(subject, remove)
+            for subject in sorted(os.listdir("data")) if os.path.isdir(os.path.join("data", subject))}
+
+
+if __name__ == "__main__":
+    # python results_store.py migrate [--remove]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        sys.exit("usage: python results_store.py migrate [--remove]")
+    for subject, count in migrate_all(remove="--remove" in sys.argv[2:]).items():
+        print(f"{subject}: {count} student results migrated")
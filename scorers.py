@@ -0,0 +1,203 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import REGISTRY
+
+# Scorer plugins and the scheduler that runs them.
+#
+# A scorer turns answers (and the matching correct answers) into
+# per-question scores, one result per column. Columns are the names
+# save_performance stores as qN_<column> ("plagiarism" -> qN_plagiarism;
+# new ones also need an entry in results_store.EXTRA_COLUMNS). Scorers work
+# on a students x questions matrix, so one student's submission, a bulk
+# grading chunk and a regrade of a few questions all go through the same
+# code. Each scorer declares
+#
+#   inputs        what it reads besides the answers: "key" (only questions
+#                 with a correct answer are scored), "nlp" (the grammar
+#                 model) and/or "subject"
+#   cost          NATIVE: the work happens in code that releases the GIL
+#                 (rapidfuzz, NumPy, the spaCy model) -> thread pool
+#                 PYTHON: CPU-bound pure Python -> process pool, if
+#                 SCORER_PROCESSES > 0 (see benchmarks/bench_scorers.py)
+#   per_question  whether its questions may be scored in separate tasks
+#
+#   @register("my_score", inputs=("key",), cost=PYTHON)
+#   def my_score(answers_matrix, correct_answers, context):
+#       return {"my_score": [[one value per answer] per student]}
+#
+# correct_answers holds the key of each column. context has the declared
+# inputs plus "questions", the key index of each column, and, for "key"
+# scorers, "key", the whole answer key.
+#
+# The scheduler splits per-question scorers into chunks of questions, and
+# large cohorts into chunks of students, and runs the tasks of all scorers
+# at once. Process-pool workers look scorers up by name, so those must be
+# registered by a module the worker imports.
+
+NATIVE = "native"
+PYTHON = "python"
+
+# Scored by evaluation.grade_batch together with the evaluation cache; the
+# batch paths run every other scorer through the scheduler
+CACHED_SCORERS = ("plagiarism", "grammar_errors")
+
+
+class Scorer:
+    __slots__ = ("name", "func", "columns", "inputs", "cost", "per_question", "enabled")
+
+    def __init__(self, name, func, columns, inputs, cost, per_question, enabled):
+        self.name = name
+        self.func = func
+        self.columns = columns
+        self.inputs = inputs
+        self.cost = cost
+        self.per_question = per_question
+        self.enabled = enabled
+
+
+SCORERS = {}
+
+def register(name, columns=None, inputs=(), cost=NATIVE, per_question=True, enabled=None):
+    def decorator(func):
+        SCORERS[name] = Scorer(name, func, tuple(columns or (name,)), tuple(inputs), cost, per_question,
+                               enabled or (lambda: True))
+        return func
+    return decorator
+
+def enabled_scorers(names=None, exclude=(), key_only=False):
+    # Names of the enabled scorers; key_only: those whose scores depend on the answer key
+    return [name for name in (names or SCORERS) if name not in exclude and SCORERS[name].enabled()
+            and (not key_only or "key" in SCORERS[name].inputs)]
+
+
+# --- Built-in scorers ---
+@register("plagiarism", inputs=("key",), cost=NATIVE)
+def plagiarism(answers_matrix, correct_answers, context):
+    from evaluation import plagiarism_check_batch
+
+    # The scheduler already runs chunks side by side, so one rapidfuzz thread each
+    return {"plagiarism": plagiarism_check_batch(answers_matrix, correct_answers, workers=1).tolist()}
+
+@register("grammar_errors", inputs=("nlp",), cost=NATIVE, per_question=False)
+def grammar_errors(answers_matrix, correct_answers, context):
+    from evaluation import grammar_check_batch
+
+    # One nlp.pipe over all answers keeps the model's batches full
+    width = len(answers_matrix[0]) if answers_matrix else 0
+    errors = grammar_check_batch(context["nlp"], [answer for row in answers_matrix for answer in row])
+    return {"grammar_errors": [errors[i:i + width] for i in range(0, len(errors), width)] if width else
+            [[] for _ in answers_matrix]}
+
+@register("copy_spans", columns=("coverage", "key_coverage", "copied_spans"), inputs=("key",), cost=PYTHON,
+          enabled=lambda: config.COPY_DETECTION)
+def copy_spans(answers_matrix, correct_answers, context):
+    from copy_spans import copy_scores
+
+    rows = [copy_scores(answers, correct_answers) for answers in answers_matrix]
+    return {column: [row[column] for row in rows] for column in ("coverage", "key_coverage", "copied_spans")}
+
+@register("semantic", inputs=("key", "subject"), cost=NATIVE, per_question=False,
+          enabled=lambda: config.SEMANTIC_SCORING)
+def semantic(answers_matrix, correct_answers, context):
+    from semantic import semantic_check_batch
+
+    # The stored key embeddings are looked up by the hash of the whole key
+    return {"semantic": semantic_check_batch(context["subject"], answers_matrix, context["key"],
+                                             questions=context["questions"]).tolist()}
+
+
+# --- Scheduling ---
+def _timed(func, answers_matrix, correct_answers, context):
+    start = time.perf_counter()
+    return func(answers_matrix, correct_answers, context), time.perf_counter() - start
+
+def _run_registered(name, answers_matrix, correct_answers, context):
+    # Entry point in process-pool workers
+    return _timed(SCORERS[name].func, answers_matrix, correct_answers, context)
+
+
+class ScorerScheduler:
+    def __init__(self, threads=config.SCORER_THREADS, processes=config.SCORER_PROCESSES,
+                 chunk_questions=config.SCORER_CHUNK_QUESTIONS, chunk_students=config.SCORER_CHUNK_STUDENTS):
+        from resources import process_pool
+
+        self.chunk_questions = max(1, chunk_questions)
+        self.chunk_students = max(1, chunk_students)
+        self._threads = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="scorer")
+        # Worker processes are started on first use
+        self._processes = process_pool(processes) if processes > 0 else None
+
+    def run(self, answers, correct_answers, context=None, names=None, known=None):
+        # Score one student's answers with the named (default: all enabled)
+        # scorers. known: {column: {question index: value}} scored elsewhere,
+        # e.g. by the evaluation cache; those questions are not scored again.
+        # Returns ({column: one value per answer}, {scorer: seconds spent in
+        # its tasks, summed}); questions a scorer skipped are None.
+        known = {column: {(0, q): value for q, value in values.items()} for column, values in (known or {}).items()}
+        scores, timings = self.run_batch([answers], correct_answers, context, names, known=known)
+        return {column: rows[0] for column, rows in scores.items()}, timings
+
+    def run_batch(self, submissions, correct_answers, context=None, names=None, questions=None, known=None):
+        # Score many students' answers (a list of answer lists, which may
+        # differ in length) with the named (default: all enabled) scorers.
+        # questions: key indexes to score (default: all); known: {column:
+        # {(student index, question index): value}} scored elsewhere, skipped
+        # for questions every student already has. Returns ({column: [one
+        # value per answer] per student}, {scorer: seconds}); answers that
+        # were not scored are None.
+        context = context or {}
+        known = known or {}
+        width = max((len(answers) for answers in submissions), default=0)
+        scores, tasks = {}, []
+        for name in enabled_scorers(names):
+            scorer = SCORERS[name]
+            for column in scorer.columns:
+                column_known = known.get(column, {})
+                scores[column] = [[column_known.get((s, q)) for q in range(len(answers))]
+                                  for s, answers in enumerate(submissions)]
+            limit = min(width, len(correct_answers)) if "key" in scorer.inputs else width
+            todo = [q for q in (range(limit) if questions is None else questions) if q < limit and not all(
+                (s, q) in known.get(column, {}) for column in scorer.columns
+                for s, answers in enumerate(submissions) if q < len(answers))]
+            if not todo:
+                continue
+            size = self.chunk_questions if scorer.per_question else len(todo)
+            in_process = scorer.cost == PYTHON and self._processes is not None and "nlp" not in scorer.inputs
+            for start in range(0, len(todo), size):
+                chunk = todo[start:start + size]
+                chunk_keys = [str(correct_answers[q]) if q < len(correct_answers) else "" for q in chunk]
+                scorer_context = {name: context[name] for name in scorer.inputs if name in context}
+                scorer_context["questions"] = chunk
+                if "key" in scorer.inputs:
+                    scorer_context["key"] = [str(answer) for answer in correct_answers]
+                for first in range(0, len(submissions), self.chunk_students):
+                    rows = range(first, min(first + self.chunk_students, len(submissions)))
+                    # Short submissions are padded; the padding is not stored
+                    matrix = [[submissions[s][q] if q < len(submissions[s]) else "" for q in chunk] for s in rows]
+                    if in_process:
+                        future = self._processes.submit(_run_registered, scorer.name, matrix, chunk_keys,
+                                                        scorer_context)
+                    else:
+                        future = self._threads.submit(_timed, scorer.func, matrix, chunk_keys, scorer_context)
+                    tasks.append((scorer, rows, chunk, future))
+
+        timings = {}
+        for scorer, rows, chunk, future in tasks:
+            result, seconds = future.result()
+            timings[scorer.name] = timings.get(scorer.name, 0.0) + seconds
+            for column in scorer.columns:
+                for s, values in zip(rows, result[column]):
+                    student_scores = scores[column][s]
+                    for q, value in zip(chunk, values):
+                        if q < len(student_scores):
+                            student_scores[q] = value
+        for name, seconds in timings.items():
+            REGISTRY.observe(f"scorer_{name}", seconds)
+        return scores, timings
+
+    def shutdown(self):
+        self._threads.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
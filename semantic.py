@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+
+import config
+from eval_cache import text_hash
+from preprocess import prepare
+from resources import cache_resource
+
+# Semantic similarity between student answers and the answer key. fuzz.ratio
+# compares characters, so a correct paraphrase scores low; here both texts
+# are embedded as the mean of their word vectors and compared by cosine.
+# The key embeddings are computed once, when the faculty saves the
+# questions, and stored in data/{subject}/{subject}_key_embeddings.npz, so
+# grading only embeds the student answers. Everything runs on CPU from the
+# locally installed spaCy model; nothing is downloaded at grading time.
+
+# Only the tokenizer and the static vectors are needed
+_PIPELINE_COMPONENTS = ["tok2vec", "tagger", "morphologizer", "parser", "senter",
+                        "attribute_ruler", "lemmatizer", "ner"]
+
+
+@cache_resource
+def get_vector_model(model_name=config.SEMANTIC_MODEL):
+    import spacy
+
+    nlp = spacy.load(model_name, exclude=_PIPELINE_COMPONENTS)
+    if not nlp.vocab.vectors_length:
+        raise ValueError(f"{model_name} has no word vectors; use e.g. en_core_web_md")
+    return nlp
+
+def model_name(nlp):
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}"
+
+def embed(nlp, texts, batch_size=config.NLP_BATCH_SIZE):
+    # Unit-length mean word vectors, one row per text (zero rows for texts
+    # without any known word)
+    vectors = np.zeros((len(texts), nlp.vocab.vectors_length), dtype=np.float32)
+    # The shared preprocessed text (see preprocess.py), as for every other scorer
+    for i, doc in enumerate(nlp.tokenizer.pipe((prepare(text).text for text in texts), batch_size=batch_size)):
+        if len(doc):
+            vectors[i] = doc.vector
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+def to_scores(cosine):
+    # Same 0-100 int scale as fuzz.ratio; opposite directions count as 0
+    return np.rint(np.clip(cosine, 0, 1) * 100).astype(np.int32)
+
+
+# --- Answer-key embeddings ---
+# subject -> (file mtime, (model, key hash), vectors)
+_key_embeddings = {}
+
+def key_embeddings_path(subject):
+    return f"data/{subject}/{subject}_key_embeddings.npz"
+
+def save_key_embeddings(subject, correct_answers, nlp=None):
+    nlp = nlp or get_vector_model()
+    vectors = embed(nlp, correct_answers)
+    np.savez(key_embeddings_path(subject), vectors=vectors, model=model_name(nlp),
+             key_hash=text_hash("\x1f".join(str(answer) for answer in correct_answers)))
+    _key_embeddings.pop(subject, None)
+    return vectors
+
+def load_key_embeddings(subject, correct_answers, nlp=None):
+    # Stored key matrix, recomputed only if it is missing or was built from
+    # other answers or another model
+    nlp = nlp or get_vector_model()
+    path = key_embeddings_path(subject)
+    expected = (model_name(nlp), text_hash("\x1f".join(str(answer) for answer in correct_answers)))
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _key_embeddings.get(subject)
+    if cached and cached[0] == mtime and cached[1] == expected:
+        return cached[2]
+    if mtime is not None:
+        with np.load(path) as stored:
+            if (str(stored["model"]), str(stored["key_hash"])) == expected:
+                _key_embeddings[subject] = (mtime, expected, stored["vectors"])
+                return stored["vectors"]
+    vectors = save_key_embeddings(subject, correct_answers, nlp)
+    _key_embeddings[subject] = (os.path.getmtime(path), expected, vectors)
+    return vectors
+
+
+# --- Scoring ---
+def semantic_check_batch(subject, answers_matrix, correct_answers, nlp=None, questions=None):
+    # students x questions answers -> students x questions scores. Column j
+    # is scored against key answer questions[j] (default: j); the whole key
+    # is passed either way, since the stored embeddings belong to it.
+    if questions is None:
+        questions = range(len(answers_matrix[0]) if len(answers_matrix) else len(correct_answers))
+    questions = list(questions)
+    if len(answers_matrix) == 0:
+        return np.zeros((0, len(questions)), dtype=np.int32)
+    nlp = nlp or get_vector_model()
+    answers = np.asarray(answers_matrix, dtype=object)
+    num_students, num_questions = answers.shape
+    keys = load_key_embeddings(subject, correct_answers, nlp)[questions[:num_questions]]
+    vectors = embed(nlp, answers.ravel().tolist()).reshape(num_students, num_questions, -1)
+    return to_scores(np.einsum("sqd,qd->sq", vectors, keys))